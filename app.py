@@ -1,10 +1,17 @@
 from flask import Flask, render_template, request, jsonify, send_file
 import os
+import random
 import uuid
 from werkzeug.utils import secure_filename
-from utils.yolo_detector import detect_and_extract_document
-from utils.dewarper import dewarp_document
-from utils.upscaler import upscale_image
+from utils.yolo_detector import detect_and_extract_document, configure_batching
+from utils.dewarper import dewarp_document, DEWARP_MODES
+from utils.upscaler import upscale_image, realesrgan_available
+from utils.profiler import profile_run
+from utils.scheduler import CoreScheduler
+from utils.encoder import (
+    build_encode_options, configure_encoder, wait_for_encode, encode_error,
+    encode_pending, encodes_in_flight, discard_output, OUTPUT_FORMATS
+)
 import shutil
 
 app = Flask(__name__)
@@ -14,6 +21,37 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'temp/uploads'
 app.config['PROCESSED_FOLDER'] = 'temp/processed'
 app.config['MODEL_PATH'] = 'models/trainedYOLO.pt'
+app.config['DEWARP_MODE'] = 'perspective'  # 'perspective' or 'mesh' (curved pages)
+app.config['FUSED_RESIZE'] = True  # Dewarp and OpenCV-upscale in one pass when Real-ESRGAN is missing
+app.config['ENCODE_WORKERS'] = 2  # Threads encoding final outputs
+app.config['ENCODE_MAX_IN_FLIGHT'] = 4  # Queued + running encodes before /process waits
+app.config['ENCODE_TIMEOUT'] = 120  # Seconds to wait for an encode on download
+app.config['PROFILE_SAMPLE_RATE'] = 0.0  # Fraction of /process runs to profile
+app.config['PROFILE_ALLOW_HEADER'] = False  # Honour the X-Profile request header
+app.config['PROFILE_FOLDER'] = 'temp/profiles'  # Profiles per session, kept by /cleanup
+app.config['CPU_CORES'] = None  # Cores shared between jobs (None = all usable cores)
+app.config['MIN_CORES_PER_JOB'] = 1  # Smallest thread budget given to a job
+app.config['MAX_CONCURRENT_JOBS'] = None  # Extra /process calls wait (None = cores / min, at least 2)
+app.config['YOLO_MAX_BATCH'] = 8  # Detection requests per batched forward pass (1 = no batching)
+app.config['YOLO_MAX_WAIT_MS'] = 5  # How long a detection waits for others to join its batch
+
+configure_encoder(app.config['ENCODE_WORKERS'], app.config['ENCODE_MAX_IN_FLIGHT'])
+
+scheduler = CoreScheduler(
+    total_cores=app.config['CPU_CORES'],
+    min_cores_per_job=app.config['MIN_CORES_PER_JOB'],
+    max_jobs=app.config['MAX_CONCURRENT_JOBS'],
+    # Background encodes keep running after their job has released its cores;
+    # queued ones beyond the encoder threads use no CPU
+    background_load=lambda: min(encodes_in_flight(), app.config['ENCODE_WORKERS'])
+)
+
+# Batched detections run on the broker's thread, sized for the jobs in the batch
+configure_batching(
+    app.config['YOLO_MAX_BATCH'],
+    app.config['YOLO_MAX_WAIT_MS'],
+    thread_budget=scheduler.batch_budget
+)
 
 # Allowed extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'tiff', 'tif', 'webp'}
@@ -24,6 +62,7 @@ def allowed_file(filename):
 def cleanup_session_files(session_id):
     """Clean up all files associated with a session"""
     try:
+        clear_final_outputs(os.path.join(app.config['PROCESSED_FOLDER'], session_id))
         upload_path = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
         processed_path = os.path.join(app.config['PROCESSED_FOLDER'], session_id)
         
@@ -34,6 +73,63 @@ def cleanup_session_files(session_id):
     except Exception as e:
         print(f"Error cleaning up session files: {e}")
 
+def final_output_paths(processed_dir):
+    return [
+        os.path.join(processed_dir, 'final_upscaled' + fmt['extension'])
+        for fmt in OUTPUT_FORMATS.values()
+    ]
+
+def clear_final_outputs(processed_dir):
+    """Remove earlier final outputs (in any format) so only the latest run is served"""
+    for path in final_output_paths(processed_dir):
+        discard_output(path, timeout=app.config['ENCODE_TIMEOUT'])
+
+def find_final_output(session_id):
+    """
+    Locate the final output of a session, waiting for a pending encode
+    
+    Returns:
+        tuple: (path, error response) - the output path, or None and the
+        response to send instead
+    """
+    session_dir = os.path.join(app.config['PROCESSED_FOLDER'], session_id)
+    for path in final_output_paths(session_dir):
+        wait_for_encode(path, timeout=app.config['ENCODE_TIMEOUT'])
+        if encode_pending(path):
+            response = jsonify({'error': 'Result is still being encoded, retry shortly'})
+            response.headers['Retry-After'] = '5'
+            return None, (response, 503)
+        error = encode_error(path)
+        if error is not None:
+            return None, (jsonify({'error': f'Encoding failed: {error}'}), 500)
+        if os.path.exists(path):
+            return path, None
+    return None, (jsonify({'error': 'File not found'}), 404)
+
+def parse_bool(value):
+    """Parse a JSON boolean, also accepting 'true'/'false'/'1'/'0' strings"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', '1'):
+        return True
+    if isinstance(value, str) and value.lower() in ('false', '0'):
+        return False
+    raise ValueError(f"Expected true or false, got {value!r}")
+
+def should_profile():
+    """Decide whether the current /process request should be profiled"""
+    if app.config['PROFILE_ALLOW_HEADER'] and request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes'):
+        return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+def get_mimetype(path):
+    extension = os.path.splitext(path)[1].lower()
+    for fmt in OUTPUT_FORMATS.values():
+        if fmt['extension'] == extension:
+            return fmt['mimetype']
+    return 'application/octet-stream'
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -71,6 +167,65 @@ def upload_file():
     
     return jsonify({'error': 'File type not allowed'}), 400
 
+def run_pipeline(session_id, input_path, processed_dir, encode_options, dewarp_mode):
+    """Run detection, dewarping and upscaling for one uploaded image"""
+    # A session processed again (possibly in another format) must not serve the old result
+    clear_final_outputs(processed_dir)
+    
+    # Step 1: YOLO Detection and Mask Extraction
+    step1_output = os.path.join(processed_dir, 'step1_extracted.png')
+    success = detect_and_extract_document(
+        input_path, 
+        app.config['MODEL_PATH'], 
+        step1_output
+    )
+    
+    if not success:
+        return jsonify({'error': 'Document detection failed. No document found in image.'}), 400
+    
+    final_output = os.path.join(processed_dir, 'final_upscaled' + encode_options['extension'])
+    
+    # Without Real-ESRGAN, the page is rendered straight at the upscaled size
+    fused = app.config['FUSED_RESIZE'] and not realesrgan_available()
+    
+    # Step 2: Dewarping and Background Removal
+    scheduler.apply_budget()
+    if fused:
+        success = dewarp_document(
+            step1_output,
+            final_output,
+            mode=dewarp_mode,
+            upscale=True,
+            encode_options=encode_options,
+            background_encode=True
+        )
+    else:
+        step2_output = os.path.join(processed_dir, 'step2_dewarped.png')
+        success = dewarp_document(step1_output, step2_output, mode=dewarp_mode)
+    
+    if not success:
+        return jsonify({'error': 'Dewarping failed. Could not straighten document borders.'}), 400
+    
+    # Step 3: Upscaling with Real-ESRGAN (final encode runs in the background)
+    if not fused:
+        scheduler.apply_budget()
+        success = upscale_image(
+            step2_output,
+            final_output,
+            encode_options=encode_options,
+            background_encode=True
+        )
+        
+        if not success:
+            return jsonify({'error': 'Upscaling failed.'}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': 'Document processed successfully',
+        'result_path': f'/download/{session_id}',
+        'output_format': encode_options['format']
+    }), 200
+
 @app.route('/process', methods=['POST'])
 def process_document():
     data = request.get_json()
@@ -80,41 +235,32 @@ def process_document():
     if not session_id or not filename:
         return jsonify({'error': 'Missing session_id or filename'}), 400
     
+    # Output encoding options (PNG by default)
+    try:
+        encode_options = build_encode_options(
+            output_format=data.get('output_format', 'png'),
+            quality=data.get('quality'),
+            png_compression=data.get('png_compression'),
+            lossless=parse_bool(data.get('lossless', False)),
+            color_mode=data.get('color_mode', 'color')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid output options: {str(e)}'}), 400
+    
+    dewarp_mode = data.get('dewarp_mode', app.config['DEWARP_MODE'])
+    if dewarp_mode not in DEWARP_MODES:
+        return jsonify({'error': f'Invalid dewarp_mode: {dewarp_mode}'}), 400
+    
     try:
         # Paths
         input_path = os.path.join(app.config['UPLOAD_FOLDER'], session_id, filename)
         processed_dir = os.path.join(app.config['PROCESSED_FOLDER'], session_id)
+        profile_dir = os.path.join(app.config['PROFILE_FOLDER'], session_id)
         
-        # Step 1: YOLO Detection and Mask Extraction
-        step1_output = os.path.join(processed_dir, 'step1_extracted.png')
-        success = detect_and_extract_document(
-            input_path, 
-            app.config['MODEL_PATH'], 
-            step1_output
-        )
-        
-        if not success:
-            return jsonify({'error': 'Document detection failed. No document found in image.'}), 400
-        
-        # Step 2: Dewarping and Background Removal
-        step2_output = os.path.join(processed_dir, 'step2_dewarped.png')
-        success = dewarp_document(step1_output, step2_output)
-        
-        if not success:
-            return jsonify({'error': 'Dewarping failed. Could not straighten document borders.'}), 400
-        
-        # Step 3: Upscaling with Real-ESRGAN
-        final_output = os.path.join(processed_dir, 'final_upscaled.png')
-        success = upscale_image(step2_output, final_output)
-        
-        if not success:
-            return jsonify({'error': 'Upscaling failed.'}), 400
-        
-        return jsonify({
-            'success': True,
-            'message': 'Document processed successfully',
-            'result_path': f'/download/{session_id}'
-        }), 200
+        # Wait for a job slot; OpenCV/torch threads are limited to the job's core budget
+        with scheduler.job(), \
+                profile_run(profile_dir, enabled=should_profile(), name=f'process {session_id}'):
+            return run_pipeline(session_id, input_path, processed_dir, encode_options, dewarp_mode)
         
     except Exception as e:
         return jsonify({'error': f'Processing error: {str(e)}'}), 500
@@ -122,16 +268,17 @@ def process_document():
 @app.route('/download/<session_id>')
 def download_file(session_id):
     try:
-        final_output = os.path.join(app.config['PROCESSED_FOLDER'], session_id, 'final_upscaled.png')
+        final_output, error_response = find_final_output(session_id)
         
-        if not os.path.exists(final_output):
-            return jsonify({'error': 'File not found'}), 404
+        if final_output is None:
+            return error_response
         
+        extension = os.path.splitext(final_output)[1]
         return send_file(
             final_output,
             as_attachment=True,
-            download_name='processed_document.png',
-            mimetype='image/png'
+            download_name='processed_document' + extension,
+            mimetype=get_mimetype(final_output)
         )
     except Exception as e:
         return jsonify({'error': f'Download error: {str(e)}'}), 500
@@ -149,12 +296,12 @@ def cleanup_session(session_id):
 def preview_result(session_id):
     """Endpoint to preview the processed image before download"""
     try:
-        final_output = os.path.join(app.config['PROCESSED_FOLDER'], session_id, 'final_upscaled.png')
+        final_output, error_response = find_final_output(session_id)
         
-        if not os.path.exists(final_output):
-            return jsonify({'error': 'File not found'}), 404
+        if final_output is None:
+            return error_response
         
-        return send_file(final_output, mimetype='image/png')
+        return send_file(final_output, mimetype=get_mimetype(final_output))
     except Exception as e:
         return jsonify({'error': f'Preview error: {str(e)}'}), 500
 
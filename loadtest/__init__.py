@@ -0,0 +1,16 @@
+from .stubs import install_stub_models, make_stub_detector, make_stub_upscaler, StubUpsampler
+from .harness import (
+    LoadGenerator, run_session, start_stub_server, start_stub_subprocess, make_test_document
+)
+
+__all__ = [
+    'install_stub_models',
+    'make_stub_detector',
+    'make_stub_upscaler',
+    'StubUpsampler',
+    'LoadGenerator',
+    'run_session',
+    'start_stub_server',
+    'start_stub_subprocess',
+    'make_test_document'
+]
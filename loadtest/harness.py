@@ -0,0 +1,519 @@
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+STAGES = ('upload', 'process', 'download', 'cleanup')
+
+
+def make_test_document(width=900, height=1200, seed=0):
+    """
+    Render a synthetic photographed page: a tilted sheet with text lines
+
+    Args:
+        width (int): Image width
+        height (int): Image height
+        seed (int): Seed for the text layout
+
+    Returns:
+        bytes: PNG-encoded image
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), (90, 110, 130), dtype=np.uint8)
+
+    page = np.array([
+        [width * 0.15, height * 0.10],
+        [width * 0.85, height * 0.12],
+        [width * 0.88, height * 0.90],
+        [width * 0.12, height * 0.88],
+    ], dtype=np.int32)
+    cv2.fillConvexPoly(image, page, (235, 235, 235))
+
+    for y in range(int(height * 0.16), int(height * 0.84), 28):
+        x = int(width * 0.2)
+        while x < width * 0.78:
+            word = int(rng.integers(20, 70))
+            cv2.line(image, (x, y), (min(x + word, int(width * 0.8)), y), (40, 40, 40), 6)
+            x += word + 15
+
+    ok, encoded = cv2.imencode('.png', image)
+    return encoded.tobytes()
+
+
+def read_rss_mb(pid):
+    """
+    Read the resident set size of a process (Linux only)
+
+    Args:
+        pid (int): Process id
+
+    Returns:
+        float: RSS in MB, or None if unavailable
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _request(url, data=None, headers=None, method='GET', timeout=300):
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def _multipart(field, filename, content, content_type):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def run_session(base_url, image_bytes, process_options=None):
+    """
+    Drive one upload -> process -> download -> cleanup session
+
+    Args:
+        base_url (str): Server URL, e.g. http://127.0.0.1:5000
+        image_bytes (bytes): PNG image to upload
+        process_options (dict): Extra fields for the /process request
+
+    Returns:
+        dict: Per-stage seconds, total seconds, and an error message or None
+    """
+    result = {'stages': {}, 'error': None}
+    start = time.perf_counter()
+
+    def timed(stage, *args, **kwargs):
+        stage_start = time.perf_counter()
+        status, body = _request(*args, **kwargs)
+        result['stages'][stage] = time.perf_counter() - stage_start
+        if status != 200:
+            try:
+                message = json.loads(body).get('error', '')
+            except ValueError:
+                message = ''
+            raise RuntimeError(f'{stage} returned {status} {message}'.strip())
+        return body
+
+    try:
+        body, headers = _multipart('file', 'document.png', image_bytes, 'image/png')
+        upload = json.loads(timed('upload', f'{base_url}/upload', body, headers, 'POST'))
+
+        payload = {'session_id': upload['session_id'], 'filename': upload['filename']}
+        payload.update(process_options or {})
+        timed('process', f'{base_url}/process', json.dumps(payload).encode(),
+              {'Content-Type': 'application/json'}, 'POST')
+
+        timed('download', f'{base_url}/download/{upload["session_id"]}')
+        timed('cleanup', f'{base_url}/cleanup/{upload["session_id"]}', b'', {}, 'POST')
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['total'] = time.perf_counter() - start
+    return result
+
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    if not values:
+        return {}
+    summary = {f'p{p}': float(np.percentile(values, p)) for p in points}
+    summary['max'] = float(max(values))
+    return summary
+
+
+class LoadGenerator:
+    """
+    Run sessions against the server in closed-loop or open-loop mode
+
+    Closed loop keeps `concurrency` sessions in flight at all times. Open
+    loop starts sessions at Poisson arrival times with the given rate (per
+    second), running at most `concurrency` at once; latency then includes
+    time spent waiting for a free client slot.
+
+    Args:
+        base_url (str): Server URL
+        image_bytes (bytes): Image to upload in every session
+        concurrency (int): Sessions in flight (closed) or maximum in flight (open)
+        duration (float): Seconds to generate load for
+        rate (float): Arrivals per second for open loop, None for closed loop
+        process_options (dict): Extra fields for the /process request
+        server_pid (int): Process whose RSS is sampled
+        sample_interval (float): Seconds between RSS samples
+        seed (int): Seed for arrival times
+    """
+
+    def __init__(self, base_url, image_bytes, concurrency=4, duration=30.0, rate=None,
+                 process_options=None, server_pid=None, sample_interval=0.5, seed=0):
+        self.base_url = base_url.rstrip('/')
+        self.image_bytes = image_bytes
+        self.concurrency = concurrency
+        self.duration = duration
+        self.rate = rate
+        self.process_options = process_options
+        self.server_pid = server_pid
+        self.sample_interval = sample_interval
+        self.random = random.Random(seed)
+        self.results = []
+        self.rss = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _record(self, result):
+        with self._lock:
+            self.results.append(result)
+
+    def _closed_loop_worker(self, deadline):
+        while time.perf_counter() < deadline:
+            self._record(run_session(self.base_url, self.image_bytes, self.process_options))
+
+    def _open_loop_session(self, arrival):
+        result = run_session(self.base_url, self.image_bytes, self.process_options)
+        # Count time queued behind busy client slots as latency
+        result['total'] = time.perf_counter() - arrival
+        self._record(result)
+
+    def _sample_rss(self, start):
+        while not self._stop.wait(self.sample_interval):
+            rss = read_rss_mb(self.server_pid)
+            if rss is not None:
+                self.rss.append((time.perf_counter() - start, rss))
+
+    def run(self):
+        """
+        Generate load and return the report
+
+        Returns:
+            dict: Throughput, latency percentiles, error rate and RSS samples
+        """
+        start = time.perf_counter()
+        deadline = start + self.duration
+
+        sampler = None
+        if self.server_pid is not None:
+            sampler = threading.Thread(target=self._sample_rss, args=(start,), daemon=True)
+            sampler.start()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            if self.rate is None:
+                for _ in range(self.concurrency):
+                    executor.submit(self._closed_loop_worker, deadline)
+            else:
+                arrival = start
+                while True:
+                    arrival += self.random.expovariate(self.rate)
+                    if arrival >= deadline:
+                        break
+                    time.sleep(max(0.0, arrival - time.perf_counter()))
+                    executor.submit(self._open_loop_session, arrival)
+
+        elapsed = time.perf_counter() - start
+        self._stop.set()
+        if sampler is not None:
+            sampler.join()
+
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        ok = [r for r in self.results if r['error'] is None]
+        errors = [r['error'] for r in self.results if r['error'] is not None]
+
+        stage_latency = {}
+        for stage in STAGES:
+            values = [r['stages'][stage] for r in ok if stage in r['stages']]
+            stage_latency[stage] = percentiles(values)
+
+        rss_values = [mb for _, mb in self.rss]
+        return {
+            'mode': 'closed' if self.rate is None else 'open',
+            'concurrency': self.concurrency,
+            'rate': self.rate,
+            'elapsed': elapsed,
+            'sessions': len(self.results),
+            'succeeded': len(ok),
+            'throughput': len(ok) / elapsed if elapsed > 0 else 0.0,
+            'error_rate': len(errors) / len(self.results) if self.results else 0.0,
+            'errors': sorted(set(errors)),
+            'latency': percentiles([r['total'] for r in ok]),
+            'stage_latency': stage_latency,
+            'rss_mb': {
+                'min': min(rss_values) if rss_values else None,
+                'max': max(rss_values) if rss_values else None,
+                'samples': self.rss,
+            },
+        }
+
+
+def start_stub_server(host='127.0.0.1', port=0, detect_latency=0.05, detect_memory_mb=0,
+                      upscale_latency=0.2, upscale_memory_mb=0):
+    """
+    Serve app.py in a background thread with stub model backends
+
+    The server shares the caller's process (and GIL); use
+    start_stub_subprocess to measure it separately from the load generator.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind (0 picks a free port)
+        detect_latency (float): Seconds per batched detection pass
+        detect_memory_mb (float): Memory held per detected image
+        upscale_latency (float): Seconds per upscale call
+        upscale_memory_mb (float): Memory held per upscale call
+
+    Returns:
+        tuple: (base URL, werkzeug server) - call server.shutdown() to stop
+    """
+    from werkzeug.serving import make_server
+
+    import app as app_module
+    from .stubs import install_stub_models
+
+    install_stub_models(
+        app_module,
+        detect_latency=detect_latency,
+        detect_memory_mb=detect_memory_mb,
+        upscale_latency=upscale_latency,
+        upscale_memory_mb=upscale_memory_mb
+    )
+
+    flask_app = app_module.app
+    os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(flask_app.config['PROCESSED_FOLDER'], exist_ok=True)
+
+    server = make_server(host, port, flask_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f'http://{host}:{server.server_port}', server
+
+
+def _free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(base_url, timeout=120, process=None):
+    """
+    Wait for a server to answer HTTP requests
+
+    Args:
+        base_url (str): Server URL
+        timeout (float): Maximum seconds to wait
+        process (subprocess.Popen): Server process; stop waiting if it exits
+
+    Returns:
+        bool: True once the server answers, False on timeout or exit
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            _request(f'{base_url}/', timeout=5)
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_stub_subprocess(host='127.0.0.1', port=None, detect_latency=0.05, detect_memory_mb=0,
+                          upscale_latency=0.2, upscale_memory_mb=0, log_path=None):
+    """
+    Start a stub-model server in its own process (python -m loadtest --serve)
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind (None picks a free port)
+        detect_latency (float): Seconds per batched detection pass
+        detect_memory_mb (float): Memory held per detected image
+        upscale_latency (float): Seconds per upscale call
+        upscale_memory_mb (float): Memory held per upscale call
+        log_path (str): File for the server's output (None discards it)
+
+    Returns:
+        tuple: (base URL, subprocess.Popen) - terminate() the process to stop
+
+    Raises:
+        RuntimeError: If the server exits or does not answer in time
+    """
+    port = port or _free_port(host)
+    command = [
+        sys.executable, '-m', 'loadtest', '--serve',
+        '--host', host, '--port', str(port),
+        '--detect-latency', str(detect_latency),
+        '--detect-memory', str(detect_memory_mb),
+        '--upscale-latency', str(upscale_latency),
+        '--upscale-memory', str(upscale_memory_mb),
+    ]
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    try:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        if log_path:
+            log.close()
+
+    base_url = f'http://{host}:{port}'
+    if not wait_until_ready(base_url, process=process):
+        process.terminate()
+        process.wait()
+        raise RuntimeError(f'Stub server did not start (exit code {process.returncode})')
+    return base_url, process
+
+
+def serve_stub_models(host, port, **stub_options):
+    """
+    Run a stub-model server in the foreground until interrupted
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind
+        **stub_options: Latency and memory options for install_stub_models
+    """
+    base_url, server = start_stub_server(host, port, **stub_options)
+
+    # Stop cleanly on terminate() so the placeholder weights file is removed
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    print(f'Serving stub models on {base_url} (pid {os.getpid()})', flush=True)
+    try:
+        while not stopped.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+
+
+def print_report(report):
+    print(f"\nMode: {report['mode']}  concurrency: {report['concurrency']}"
+          + (f"  rate: {report['rate']}/s" if report['rate'] else ''))
+    print(f"Sessions: {report['sessions']}  succeeded: {report['succeeded']}  "
+          f"error rate: {report['error_rate']:.1%}")
+    print(f"Throughput: {report['throughput']:.2f} sessions/s over {report['elapsed']:.1f}s")
+
+    def fmt(summary):
+        return '  '.join(f"{k}={v * 1000:.0f}ms" for k, v in summary.items()) or 'n/a'
+
+    print(f"Latency: {fmt(report['latency'])}")
+    for stage, summary in report['stage_latency'].items():
+        print(f"  {stage:<9}{fmt(summary)}")
+
+    rss = report['rss_mb']
+    if rss['samples']:
+        print(f"Server RSS: {rss['min']:.0f}-{rss['max']:.0f} MB")
+        step = max(1, len(rss['samples']) // 10)
+        print('  ' + '  '.join(f"{t:.1f}s:{mb:.0f}MB" for t, mb in rss['samples'][::step]))
+
+    for error in report['errors']:
+        print(f"Error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test the document processing service'
+    )
+    parser.add_argument('--url', help='Test a running server instead of starting a stub server')
+    parser.add_argument('--server-pid', type=int, help='PID whose RSS is sampled (with --url)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Only run a stub-model server (on --host/--port) until interrupted')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run the stub server inside the load generator instead of a subprocess')
+    parser.add_argument('--host', default='127.0.0.1', help='Stub server interface')
+    parser.add_argument('--port', type=int, help='Stub server port (default: a free port)')
+    parser.add_argument('--server-log', help='File for the stub server subprocess output')
+    parser.add_argument('--concurrency', type=int, default=4, help='Sessions in flight')
+    parser.add_argument('--rate', type=float, help='Open-loop arrivals per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of load')
+    parser.add_argument('--image', help='Image to upload (defaults to a synthetic page)')
+    parser.add_argument('--output-format', default='png', help='output_format for /process')
+    parser.add_argument('--dewarp-mode', default='perspective', help='dewarp_mode for /process')
+    parser.add_argument('--detect-latency', type=float, default=0.05, help='Stub YOLO seconds per batched pass')
+    parser.add_argument('--detect-memory', type=float, default=0, help='Stub YOLO MB per image')
+    parser.add_argument('--upscale-latency', type=float, default=0.2, help='Stub Real-ESRGAN seconds per call')
+    parser.add_argument('--upscale-memory', type=float, default=0, help='Stub Real-ESRGAN MB per call')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for arrivals and the synthetic page')
+    parser.add_argument('--json', help='Write the full report to this file')
+    args = parser.parse_args()
+
+    stub_options = {
+        'detect_latency': args.detect_latency,
+        'detect_memory_mb': args.detect_memory,
+        'upscale_latency': args.upscale_latency,
+        'upscale_memory_mb': args.upscale_memory,
+    }
+
+    if args.serve:
+        serve_stub_models(args.host, args.port or 5000, **stub_options)
+        return
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = make_test_document(seed=args.seed)
+
+    server = None
+    process = None
+    if args.url:
+        base_url, server_pid = args.url, args.server_pid
+    elif args.in_process:
+        base_url, server = start_stub_server(args.host, args.port or 0, **stub_options)
+        # The stub server shares this process, so its RSS includes the client
+        server_pid = os.getpid()
+    else:
+        base_url, process = start_stub_subprocess(
+            args.host, args.port, log_path=args.server_log, **stub_options
+        )
+        server_pid = process.pid
+
+    try:
+        generator = LoadGenerator(
+            base_url,
+            image_bytes,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            rate=args.rate,
+            process_options={'output_format': args.output_format, 'dewarp_mode': args.dewarp_mode},
+            server_pid=server_pid,
+            seed=args.seed
+        )
+        report = generator.run()
+    finally:
+        if server is not None:
+            server.shutdown()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
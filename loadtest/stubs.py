@@ -0,0 +1,124 @@
+import atexit
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import utils.upscaler as upscaler
+import utils.yolo_detector as yolo_detector
+
+
+def _hold_memory(megabytes, seconds):
+    """Keep megabytes of touched memory allocated for the given time"""
+    block = np.ones(int(megabytes * 1024 * 1024), dtype=np.uint8) if megabytes > 0 else None
+    time.sleep(seconds)
+    del block
+
+
+def make_stub_detector(latency=0.05, memory_mb=0):
+    """
+    Build a stand-in for the batched YOLO forward pass (first_masks)
+
+    The stub marks the central 80% of each image as the document mask, and
+    takes a fixed time per batch and a fixed amount of memory per image.
+    Batching, mask post-processing and extraction stay real.
+
+    Args:
+        latency (float): Seconds each batched forward pass takes
+        memory_mb (float): Memory held per image during the pass
+
+    Returns:
+        function: Stub with the same signature as first_masks
+    """
+    def first_masks(model, images):
+        _hold_memory(memory_mb * len(images), latency)
+
+        masks = []
+        for image in images:
+            height, width = image.shape[:2]
+            mask = np.zeros((height, width), dtype=np.float32)
+            mask[height // 10:height - height // 10, width // 10:width - width // 10] = 1.0
+            masks.append(mask)
+        return masks
+
+    return first_masks
+
+
+class StubUpsampler:
+    """
+    Stand-in for RealESRGANer: bilinear resize with a fixed cost
+
+    Args:
+        latency (float): Seconds each enhance() call takes
+        memory_mb (float): Memory held during each call
+    """
+
+    def __init__(self, latency=0.2, memory_mb=0):
+        self.latency = latency
+        self.memory_mb = memory_mb
+
+    def enhance(self, image, outscale=4):
+        _hold_memory(self.memory_mb, self.latency)
+        height, width = image.shape[:2]
+        output = cv2.resize(
+            image,
+            (int(width * outscale), int(height * outscale)),
+            interpolation=cv2.INTER_LINEAR
+        )
+        return output, None
+
+
+def make_stub_upscaler(latency=0.2, memory_mb=0):
+    """
+    Build a stand-in for create_upsampler that returns a StubUpsampler
+
+    Args:
+        latency (float): Seconds each upscale takes
+        memory_mb (float): Memory held during each upscale
+
+    Returns:
+        function: Stub with the same signature as create_upsampler
+    """
+    def create_upsampler(model_path, build_model, scale, tile, tile_pad, pre_pad, half, device):
+        return StubUpsampler(latency, memory_mb)
+
+    return create_upsampler
+
+
+def _placeholder_model_file():
+    fd, path = tempfile.mkstemp(prefix='stub-yolo-', suffix='.pt')
+    os.close(fd)
+    atexit.register(os.remove, path)
+    return path
+
+
+def install_stub_models(app_module, detect_latency=0.05, detect_memory_mb=0,
+                        upscale_latency=0.2, upscale_memory_mb=0):
+    """
+    Replace the YOLO and Real-ESRGAN model backends of the Flask app with stubs
+
+    Only model loading and the forward passes are stubbed: the inference
+    broker, mask post-processing, dewarping, encoding, scheduling and the
+    HTTP layer stay real. The Real-ESRGAN stub is only reached where
+    realesrgan and torch are installed; otherwise the app takes its OpenCV
+    path, as it would in production.
+
+    Args:
+        app_module (module): The imported app module
+        detect_latency (float): Seconds per batched detection pass
+        detect_memory_mb (float): Memory held per detected image
+        upscale_latency (float): Seconds per upscale call
+        upscale_memory_mb (float): Memory held per upscale call
+    """
+    yolo_detector.load_yolo_model = lambda model_path: object()
+    yolo_detector.first_masks = make_stub_detector(detect_latency, detect_memory_mb)
+    # Brokers bind first_masks when created, so start from fresh ones
+    with yolo_detector._brokers_lock:
+        yolo_detector._brokers.clear()
+
+    upscaler.create_upsampler = make_stub_upscaler(upscale_latency, upscale_memory_mb)
+
+    # Detection checks that the weights file exists before using the broker
+    app_module.app.config['MODEL_PATH'] = _placeholder_model_file()
@@ -52,7 +52,7 @@ echo        CPU version - works on all systems
 pip install torch torchvision --index-url https://download.pytorch.org/whl/cpu
 
 echo [6/7] Installing core dependencies...
-pip install opencv-python flask werkzeug pillow ultralytics
+pip install opencv-python flask werkzeug pillow ultralytics safetensors
 
 echo [7/7] Installing Real-ESRGAN components...
 echo        Note: This step may take 2-3 minutes
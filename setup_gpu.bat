@@ -54,7 +54,7 @@ echo        This may take 5-10 minutes depending on your internet speed...
 pip install torch torchvision --index-url https://download.pytorch.org/whl/cu118
 
 echo [6/7] Installing core dependencies...
-pip install opencv-python flask werkzeug pillow ultralytics
+pip install opencv-python flask werkzeug pillow ultralytics safetensors
 
 echo [7/7] Installing Real-ESRGAN components...
 pip uninstall basicsr -y >nul 2>&1
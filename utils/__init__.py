@@ -1,14 +1,40 @@
-from .yolo_detector import detect_and_extract_document, get_document_bounds
-from .dewarper import dewarp_document, remove_white_background, enhance_document
-from .upscaler import upscale_image, upscale_opencv, get_image_quality_score
+from .yolo_detector import detect_and_extract_document, get_document_bounds, configure_batching, extract_document
+from .dewarper import dewarp_document, dewarp_image, remove_white_background, enhance_document, mesh_dewarp
+from .upscaler import upscale_image, upscale_opencv, upscale_array, get_image_quality_score
+from .encoder import (
+    build_encode_options, encode_image, save_image, wait_for_encode, encode_error, discard_output,
+    encode_pending, encodes_in_flight
+)
+from .profiler import profile_run
+from .scheduler import CoreScheduler, set_thread_budget
+from .frame_pool import FramePool, FrameHandle, read_image_to_pool
 
 __all__ = [
     'detect_and_extract_document',
     'get_document_bounds',
+    'configure_batching',
+    'extract_document',
     'dewarp_document',
+    'dewarp_image',
     'remove_white_background',
     'enhance_document',
+    'mesh_dewarp',
     'upscale_image',
     'upscale_opencv',
-    'get_image_quality_score'
+    'upscale_array',
+    'get_image_quality_score',
+    'build_encode_options',
+    'encode_image',
+    'save_image',
+    'wait_for_encode',
+    'encode_error',
+    'discard_output',
+    'encode_pending',
+    'encodes_in_flight',
+    'profile_run',
+    'CoreScheduler',
+    'set_thread_budget',
+    'FramePool',
+    'FrameHandle',
+    'read_image_to_pool'
 ]
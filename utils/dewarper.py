@@ -1,6 +1,29 @@
 import cv2
 import numpy as np
 import os
+import threading
+from collections import OrderedDict
+
+from .encoder import save_image
+from .upscaler import choose_upscale_factor, resize_and_sharpen, unsharp_mask
+
+
+DEWARP_MODES = ('perspective', 'mesh')
+
+# Mesh dewarping settings
+MESH_WORK_SIZE = 512  # Longest side of the copy used to estimate the mesh
+MESH_GRID_SIZE = 33  # Grid nodes along each border
+MESH_REUSE_TOLERANCE = 0.004  # Max grid difference (fraction of image size) to reuse maps
+MESH_CACHE_BYTES = 128 * 1024 * 1024  # Memory held by cached remap tables (6 bytes/output pixel)
+
+# Interpolation when rendering straight at the upscaled size. Lanczos is not
+# separable inside warpPerspective/remap and costs several times more than
+# cubic there, while a single cubic pass is still sharper than warp + resize.
+FUSED_INTERPOLATION = cv2.INTER_CUBIC
+
+# Recently built remap tables, reused for pages with similar geometry
+_mesh_cache = OrderedDict()
+_mesh_cache_lock = threading.Lock()
 
 
 def remove_white_background(image):
@@ -52,13 +75,15 @@ def order_points(pts):
     return rect
 
 
-def four_point_transform(image, pts):
+def four_point_transform(image, pts, upscale=False):
     """
     Apply perspective transform to get bird's eye view of document
     
     Args:
         image (numpy.ndarray): Input image
         pts (numpy.ndarray): Source points
+        upscale (bool): Render directly at the upscaled size and sharpen,
+            instead of resizing the warped image afterwards
     
     Returns:
         numpy.ndarray: Transformed image with straight borders
@@ -87,18 +112,379 @@ def four_point_transform(image, pts):
     
     # Compute the perspective transform matrix and apply it
     M = cv2.getPerspectiveTransform(rect, dst)
-    warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
     
-    return warped
+    scale = choose_upscale_factor(maxWidth, maxHeight) if upscale else 1
+    if scale == 1:
+        return cv2.warpPerspective(image, M, (maxWidth, maxHeight))
+    
+    # Fold the upscale into the warp (about pixel centres, like cv2.resize)
+    # so the page is interpolated once, at the final size
+    S = np.array([
+        [scale, 0, (scale - 1) / 2],
+        [0, scale, (scale - 1) / 2],
+        [0, 0, 1]
+    ])
+    warped = cv2.warpPerspective(
+        image,
+        S @ M,
+        (maxWidth * scale, maxHeight * scale),
+        flags=FUSED_INTERPOLATION
+    )
+    
+    return unsharp_mask(warped)
+
+
+def perspective_dewarp(no_bg_image, upscale=False):
+    """
+    Straighten the document with a single perspective transform
+
+    Args:
+        no_bg_image (numpy.ndarray): Image with white background removed
+        upscale (bool): Render at the upscaled size (see four_point_transform)
+
+    Returns:
+        numpy.ndarray: Dewarped image, or None if no document contour was found
+    """
+    # Convert to grayscale for contour detection
+    gray = cv2.cvtColor(no_bg_image, cv2.COLOR_BGR2GRAY)
+    
+    # Apply threshold
+    _, thresh = cv2.threshold(
+        gray, 
+        0, 
+        255, 
+        cv2.THRESH_BINARY + cv2.THRESH_OTSU
+    )
+    
+    # Find contours
+    contours, _ = cv2.findContours(
+        thresh, 
+        cv2.RETR_EXTERNAL, 
+        cv2.CHAIN_APPROX_SIMPLE
+    )
+    
+    if not contours:
+        print("No contours found for dewarping")
+        return None
+    
+    # Find the largest contour (document)
+    largest_contour = max(contours, key=cv2.contourArea)
+    
+    # Get the minimum area rectangle for perspective correction
+    rect = cv2.minAreaRect(largest_contour)
+    box = cv2.boxPoints(rect)
+    box = box.astype(np.int32)
+    
+    # Apply perspective transform to straighten borders
+    try:
+        dewarped = four_point_transform(
+            no_bg_image, 
+            box.reshape(4, 2).astype(np.float32),
+            upscale=upscale
+        )
+    except Exception as e:
+        print(f"Error applying perspective transform: {e}")
+        # If dewarping fails, save the image without background removal
+        dewarped = no_bg_image
+        if upscale:
+            scale = choose_upscale_factor(dewarped.shape[1], dewarped.shape[0])
+            if scale > 1:
+                dewarped = resize_and_sharpen(dewarped, scale)
+    
+    return dewarped
+
+
+def resample_curve(points, num_points):
+    """
+    Resample a polyline to evenly spaced points along its arc length
+
+    Args:
+        points (numpy.ndarray): Polyline points, shape (N, 2)
+        num_points (int): Number of output points
+
+    Returns:
+        tuple: (resampled points of shape (num_points, 2), total arc length)
+    """
+    segment_lengths = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1))
+    distance = np.concatenate([[0.0], np.cumsum(segment_lengths)])
+    length = distance[-1]
+
+    if length == 0:
+        return np.repeat(points[:1], num_points, axis=0), 0.0
+
+    targets = np.linspace(0.0, length, num_points)
+    x = np.interp(targets, distance, points[:, 0])
+    y = np.interp(targets, distance, points[:, 1])
+    return np.stack([x, y], axis=1), length
+
+
+def estimate_page_borders(mask, num_points):
+    """
+    Split the page outline into its top, right, bottom and left borders
+
+    Args:
+        mask (numpy.ndarray): Binary page mask
+        num_points (int): Number of points to sample along each border
+
+    Returns:
+        dict: Borders (each (num_points, 2), running left-to-right or
+            top-to-bottom) and their lengths, or None if no page was found
+    """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return None
+
+    largest_contour = max(contours, key=cv2.contourArea)
+    contour = largest_contour.reshape(-1, 2).astype(np.float32)
+    n = len(contour)
+    if n < 8:
+        return None
+
+    # Page corners are the outline points closest to the bounding box corners
+    box = order_points(cv2.boxPoints(cv2.minAreaRect(largest_contour)))
+    corners = [int(np.argmin(((contour - c) ** 2).sum(axis=1))) for c in box]
+
+    def forward(a, b):
+        return (b - a) % n
+
+    # Make the outline run tl -> tr -> br -> bl
+    if forward(corners[0], corners[1]) > forward(corners[0], corners[3]):
+        contour = contour[::-1]
+        corners = [n - 1 - i for i in corners]
+
+    offsets = [forward(corners[0], i) for i in corners]
+    if not offsets[0] < offsets[1] < offsets[2] < offsets[3]:
+        return None
+
+    def segment(a, b):
+        if b >= a:
+            return contour[a:b + 1]
+        return np.concatenate([contour[a:], contour[:b + 1]])
+
+    tl, tr, br, bl = corners
+    top, top_length = resample_curve(segment(tl, tr), num_points)
+    right, right_length = resample_curve(segment(tr, br), num_points)
+    bottom, bottom_length = resample_curve(segment(br, bl)[::-1], num_points)
+    left, left_length = resample_curve(segment(bl, tl)[::-1], num_points)
+
+    return {
+        'top': top,
+        'right': right,
+        'bottom': bottom,
+        'left': left,
+        'width': (top_length + bottom_length) / 2,
+        'height': (left_length + right_length) / 2,
+    }
+
+
+def coons_patch(top, right, bottom, left):
+    """
+    Interpolate a grid between four boundary curves (bilinear Coons patch)
+
+    Args:
+        top (numpy.ndarray): Top border, shape (cols, 2)
+        right (numpy.ndarray): Right border, shape (rows, 2)
+        bottom (numpy.ndarray): Bottom border, shape (cols, 2)
+        left (numpy.ndarray): Left border, shape (rows, 2)
+
+    Returns:
+        numpy.ndarray: Source coordinates for each grid node, shape (rows, cols, 2)
+    """
+    u = np.linspace(0.0, 1.0, len(top))[np.newaxis, :, np.newaxis]
+    v = np.linspace(0.0, 1.0, len(left))[:, np.newaxis, np.newaxis]
+
+    ruled_u = (1 - v) * top[np.newaxis] + v * bottom[np.newaxis]
+    ruled_v = (1 - u) * left[:, np.newaxis] + u * right[:, np.newaxis]
+    corners = ((1 - u) * (1 - v) * top[0] + u * (1 - v) * top[-1]
+               + (1 - u) * v * bottom[0] + u * v * bottom[-1])
+
+    return ruled_u + ruled_v - corners
+
+
+def upsample_grid(grid, width, height):
+    """
+    Bilinearly upsample a coarse grid so its corner nodes land on the output corners
+
+    Args:
+        grid (numpy.ndarray): Coarse values, shape (rows, cols)
+        width (int): Output width
+        height (int): Output height
+
+    Returns:
+        numpy.ndarray: Dense float32 values, shape (height, width)
+    """
+    rows, cols = grid.shape
+
+    xs = np.linspace(0, cols - 1, width)
+    x0 = np.minimum(xs.astype(np.int32), cols - 2)
+    tx = (xs - x0).astype(np.float32)
+    horizontal = grid[:, x0] * (1 - tx) + grid[:, x0 + 1] * tx
+
+    ys = np.linspace(0, rows - 1, height)
+    y0 = np.minimum(ys.astype(np.int32), rows - 2)
+    ty = (ys - y0).astype(np.float32)[:, np.newaxis]
+    dense = horizontal[y0] * (1 - ty) + horizontal[y0 + 1] * ty
+
+    return dense.astype(np.float32)
+
+
+def _find_cached_maps(image_shape, upscale, grid, tolerance):
+    with _mesh_cache_lock:
+        for key, entry in _mesh_cache.items():
+            if entry['image_shape'] != image_shape or entry['upscale'] != upscale:
+                continue
+            if np.abs(entry['grid'] - grid).max() <= tolerance:
+                _mesh_cache.move_to_end(key)
+                return entry
+    return None
+
+
+def _store_cached_maps(entry):
+    if entry['nbytes'] > MESH_CACHE_BYTES:
+        return
+    with _mesh_cache_lock:
+        _mesh_cache[id(entry)] = entry
+        # Evict least recently used tables until the cache fits its budget
+        while sum(e['nbytes'] for e in _mesh_cache.values()) > MESH_CACHE_BYTES:
+            _mesh_cache.popitem(last=False)
+
+
+def mesh_dewarp(image, target=None, upscale=False):
+    """
+    Flatten a curved page using a displacement mesh estimated from its borders
+
+    The page outline is found on a downscaled copy, its four borders are
+    interpolated into a coarse grid, and the grid is upsampled into remap
+    tables at full resolution. Tables are cached (up to MESH_CACHE_BYTES) and
+    reused for pages whose geometry is nearly the same.
+
+    Args:
+        image (numpy.ndarray): Document on a white background (YOLO output)
+        target (numpy.ndarray): Image to remap (defaults to image)
+        upscale (bool): Build the tables at the upscaled size and sharpen,
+            so the page is interpolated only once
+
+    Returns:
+        numpy.ndarray: Dewarped image, or None if the page could not be found
+    """
+    if target is None:
+        target = image
+
+    height, width = image.shape[:2]
+    scale = min(1.0, MESH_WORK_SIZE / max(height, width))
+    small = cv2.resize(
+        image,
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        interpolation=cv2.INTER_AREA
+    )
+
+    # The page is everything that is not the pure white fill around it
+    background = cv2.inRange(small, (250, 250, 250), (255, 255, 255))
+    mask = cv2.bitwise_not(background)
+    kernel = np.ones((5, 5), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+    borders = estimate_page_borders(mask, MESH_GRID_SIZE)
+    if borders is None:
+        print("No page outline found for mesh dewarping")
+        return None
+
+    # Grid of source coordinates at full resolution. Pixel centres map as
+    # (x + 0.5) * s - 0.5, with each axis scaled by its actual resize ratio
+    scale_x = width / small.shape[1]
+    scale_y = height / small.shape[0]
+    grid = coons_patch(
+        borders['top'], borders['right'], borders['bottom'], borders['left']
+    )
+    grid[:, :, 0] = (grid[:, :, 0] + 0.5) * scale_x - 0.5
+    grid[:, :, 1] = (grid[:, :, 1] + 0.5) * scale_y - 0.5
+
+    tolerance = MESH_REUSE_TOLERANCE * max(height, width)
+    entry = _find_cached_maps((height, width), upscale, grid, tolerance)
+
+    if entry is None:
+        out_width = max(2, int(round(borders['width'] * scale_x)))
+        out_height = max(2, int(round(borders['height'] * scale_y)))
+        out_scale = choose_upscale_factor(out_width, out_height) if upscale else 1
+        out_width *= out_scale
+        out_height *= out_scale
+
+        map_x = upsample_grid(grid[:, :, 0], out_width, out_height)
+        map_y = upsample_grid(grid[:, :, 1], out_width, out_height)
+
+        # Fixed-point maps remap faster and take half the memory
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        entry = {
+            'image_shape': (height, width),
+            'upscale': upscale,
+            'scale': out_scale,
+            'grid': grid,
+            'maps': (map1, map2),
+            'nbytes': map1.nbytes + map2.nbytes,
+        }
+        _store_cached_maps(entry)
+    else:
+        print("Reusing cached mesh for similar page geometry")
+
+    map1, map2 = entry['maps']
+    if entry['scale'] == 1:
+        return cv2.remap(target, map1, map2, cv2.INTER_LINEAR)
+    return unsharp_mask(cv2.remap(target, map1, map2, FUSED_INTERPOLATION))
+
+
+def dewarp_image(image, mode='perspective', upscale=False, out=None):
+    """
+    Remove the white background from an image array and dewarp it
+
+    Array-in/array-out counterpart of dewarp_document, for frames that are
+    already in memory such as FramePool views. The input is only read.
+
+    Args:
+        image (numpy.ndarray): Input BGR image
+        mode (str): 'perspective' for flat pages, 'mesh' for curved pages
+        upscale (bool): Fuse the OpenCV upscale into the dewarp
+        out (numpy.ndarray): Array to write the result into, e.g. a shared
+            frame; only used when it has the result's shape and dtype
+
+    Returns:
+        numpy.ndarray: Dewarped image (out when it was used), or None if it failed
+    """
+    # Remove white background
+    no_bg_image = remove_white_background(image)
+    
+    dewarped = None
+    if mode == 'mesh':
+        dewarped = mesh_dewarp(image, no_bg_image, upscale=upscale)
+        if dewarped is None:
+            print("Falling back to perspective correction...")
+    
+    if dewarped is None:
+        dewarped = perspective_dewarp(no_bg_image, upscale=upscale)
+        if dewarped is None:
+            return None
+    
+    if out is not None and out.shape == dewarped.shape and out.dtype == dewarped.dtype:
+        np.copyto(out, dewarped)
+        return out
+    return dewarped
 
 
-def dewarp_document(image_path, output_path):
+def dewarp_document(image_path, output_path, mode='perspective', upscale=False,
+                    encode_options=None, background_encode=False):
     """
     Process document: remove white background and dewarp to straight borders
     
+    With upscale=True the page is rendered straight at the size upscale_opencv
+    would produce and sharpened, replacing the separate OpenCV upscaling step.
+    
     Args:
         image_path (str): Path to input image
         output_path (str): Path to save dewarped image
+        mode (str): 'perspective' for flat pages, 'mesh' for curved pages
+        upscale (bool): Fuse the OpenCV upscale into the dewarp
+        encode_options (dict): Output encoding when upscale is set
+        background_encode (bool): Encode in the encoder thread pool when upscale is set
     
     Returns:
         bool: True if successful, False otherwise
@@ -110,49 +496,15 @@ def dewarp_document(image_path, output_path):
             print(f"Error: Could not read image at {image_path}")
             return False
         
-        # Remove white background
-        no_bg_image = remove_white_background(image)
-        
-        # Convert to grayscale for contour detection
-        gray = cv2.cvtColor(no_bg_image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply threshold
-        _, thresh = cv2.threshold(
-            gray, 
-            0, 
-            255, 
-            cv2.THRESH_BINARY + cv2.THRESH_OTSU
-        )
-        
-        # Find contours
-        contours, _ = cv2.findContours(
-            thresh, 
-            cv2.RETR_EXTERNAL, 
-            cv2.CHAIN_APPROX_SIMPLE
-        )
-        
-        if not contours:
-            print("No contours found for dewarping")
+        dewarped = dewarp_image(image, mode=mode, upscale=upscale)
+        if dewarped is None:
             return False
         
-        # Find the largest contour (document)
-        largest_contour = max(contours, key=cv2.contourArea)
-        
-        # Get the minimum area rectangle for perspective correction
-        rect = cv2.minAreaRect(largest_contour)
-        box = cv2.boxPoints(rect)
-        box = box.astype(np.int32)
-        
-        # Apply perspective transform to straighten borders
-        try:
-            dewarped = four_point_transform(
-                no_bg_image, 
-                box.reshape(4, 2).astype(np.float32)
-            )
-        except Exception as e:
-            print(f"Error applying perspective transform: {e}")
-            # If dewarping fails, save the image without background removal
-            dewarped = no_bg_image
+        if upscale:
+            if not save_image(dewarped, output_path, encode_options, background_encode):
+                return False
+            print(f"Document dewarped at {dewarped.shape[1]}x{dewarped.shape[0]} and saved to {output_path}")
+            return True
         
         # Ensure output directory exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -0,0 +1,320 @@
+import cv2
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Supported output formats: file extension and MIME type
+OUTPUT_FORMATS = {
+    'png': {'extension': '.png', 'mimetype': 'image/png'},
+    'jpeg': {'extension': '.jpg', 'mimetype': 'image/jpeg'},
+    'webp': {'extension': '.webp', 'mimetype': 'image/webp'},
+}
+
+COLOR_MODES = ('color', 'grayscale', 'bilevel')
+
+# Thread pool used for background encodes of final outputs
+_executor = None
+_executor_lock = threading.Lock()
+_max_workers = 2
+
+# Limits queued and running background encodes; each holds a full-size image
+_max_in_flight = 4
+_in_flight_slots = threading.BoundedSemaphore(_max_in_flight)
+
+# Background encodes still in flight, and failed ones, keyed by output path
+_pending = {}
+_failed = {}
+_in_flight = 0
+_pending_lock = threading.Lock()
+
+
+def configure_encoder(max_workers, max_in_flight=None):
+    """
+    Set the number of threads used for background encoding
+
+    Args:
+        max_workers (int): Size of the encoding thread pool
+        max_in_flight (int): Background encodes that may be queued or running
+            at once; save_image blocks beyond this (defaults to 2 per thread)
+    """
+    global _max_workers, _max_in_flight, _in_flight_slots
+    _max_workers = max(1, int(max_workers))
+    _max_in_flight = max(1, int(max_in_flight or 2 * _max_workers))
+    _in_flight_slots = threading.BoundedSemaphore(_max_in_flight)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_max_workers,
+                thread_name_prefix='encoder'
+            )
+        return _executor
+
+
+def build_encode_options(output_format='png', quality=None,
+                         png_compression=None, lossless=False,
+                         color_mode='color'):
+    """
+    Validate user encoding choices and build the matching OpenCV parameters
+
+    Args:
+        output_format (str): One of 'png', 'jpeg' ('jpg') or 'webp'
+        quality (int): JPEG/WebP quality (1-100)
+        png_compression (int): PNG compression level (0-9)
+        lossless (bool): Use lossless WebP
+        color_mode (str): 'color', 'grayscale' or 'bilevel' (text-only pages)
+
+    Returns:
+        dict: Encoding options (format, extension, mimetype, params, color_mode)
+
+    Raises:
+        ValueError: If any option is out of range or unknown
+    """
+    output_format = (output_format or 'png').lower()
+    if output_format == 'jpg':
+        output_format = 'jpeg'
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    color_mode = (color_mode or 'color').lower()
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"Unsupported color mode: {color_mode}")
+
+    if quality is not None:
+        quality = int(quality)
+        if not 1 <= quality <= 100:
+            raise ValueError("Quality must be between 1 and 100")
+
+    if png_compression is not None:
+        png_compression = int(png_compression)
+        if not 0 <= png_compression <= 9:
+            raise ValueError("PNG compression must be between 0 and 9")
+
+    if output_format == 'png':
+        # Without an explicit level OpenCV uses its fastest settings
+        # (Z_BEST_SPEED with the RLE strategy)
+        params = []
+        if png_compression is not None:
+            params += [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        if color_mode == 'bilevel':
+            params += [cv2.IMWRITE_PNG_BILEVEL, 1]
+    elif output_format == 'jpeg':
+        params = [
+            cv2.IMWRITE_JPEG_QUALITY, 90 if quality is None else quality,
+            cv2.IMWRITE_JPEG_OPTIMIZE, 1
+        ]
+    else:
+        # OpenCV switches WebP to lossless mode for quality above 100
+        webp_quality = 101 if lossless else (90 if quality is None else quality)
+        params = [cv2.IMWRITE_WEBP_QUALITY, webp_quality]
+
+    return {
+        'format': output_format,
+        'extension': OUTPUT_FORMATS[output_format]['extension'],
+        'mimetype': OUTPUT_FORMATS[output_format]['mimetype'],
+        'params': params,
+        'color_mode': color_mode,
+    }
+
+
+def convert_color_mode(image, color_mode):
+    """
+    Convert an image to the requested color mode before encoding
+
+    Args:
+        image (numpy.ndarray): BGR image
+        color_mode (str): 'color', 'grayscale' or 'bilevel'
+
+    Returns:
+        numpy.ndarray: Converted image
+    """
+    if color_mode == 'color':
+        return image
+
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if color_mode == 'grayscale':
+        return gray
+
+    # Otsu picks the text/paper split for bilevel output
+    _, bilevel = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return bilevel
+
+
+def _write_image(image, output_path, options):
+    if options is None:
+        options = build_encode_options()
+
+    image = convert_color_mode(image, options['color_mode'])
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # Write to a temporary name so readers never see a partial file
+    root, ext = os.path.splitext(output_path)
+    temp_path = f"{root}.partial{ext}"
+    try:
+        if not cv2.imwrite(temp_path, image, options['params']):
+            raise RuntimeError(f"Could not encode image to {output_path}")
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def encode_image(image, output_path, options=None):
+    """
+    Encode an image to disk using the given encoding options
+
+    Args:
+        image (numpy.ndarray): Image to save
+        output_path (str): Destination path
+        options (dict): Result of build_encode_options (defaults to PNG)
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        _write_image(image, output_path, options)
+        return True
+    except Exception as e:
+        print(f"Error encoding image: {str(e)}")
+        return False
+
+
+def _encode_in_background(image, output_path, options):
+    try:
+        _write_image(image, output_path, options)
+        return True
+    except Exception as e:
+        print(f"Error encoding image: {str(e)}")
+        # Kept so a later download can report why the file is missing
+        with _pending_lock:
+            _failed[output_path] = str(e)
+        return False
+
+
+def save_image(image, output_path, options=None, background=False):
+    """
+    Save an image, optionally encoding it in the background thread pool
+
+    Args:
+        image (numpy.ndarray): Image to save
+        output_path (str): Destination path
+        options (dict): Result of build_encode_options (defaults to PNG)
+        background (bool): Return immediately and encode in the thread pool
+
+    Returns:
+        bool: True if successful (or scheduled), False otherwise
+    """
+    global _in_flight
+
+    if not background:
+        return encode_image(image, output_path, options)
+
+    # Wait for room so queued encodes (and their images) cannot pile up
+    slots = _in_flight_slots
+    slots.acquire()
+    try:
+        with _pending_lock:
+            _failed.pop(output_path, None)
+            future = _get_executor().submit(_encode_in_background, image, output_path, options)
+            _pending[output_path] = future
+            _in_flight += 1
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: _forget_pending(output_path, future, slots))
+    return True
+
+
+def _forget_pending(output_path, future, slots):
+    global _in_flight
+    with _pending_lock:
+        if _pending.get(output_path) is future:
+            del _pending[output_path]
+        _in_flight -= 1
+    slots.release()
+
+
+def encodes_in_flight():
+    """
+    Count background encodes that are queued or running
+
+    Returns:
+        int: Number of encodes in flight
+    """
+    with _pending_lock:
+        return _in_flight
+
+
+def encode_pending(output_path):
+    """
+    Check whether a background encode of output_path has not finished yet
+
+    Args:
+        output_path (str): Destination path passed to save_image
+
+    Returns:
+        bool: True if the encode is still queued or running
+    """
+    with _pending_lock:
+        return output_path in _pending
+
+
+def wait_for_encode(output_path, timeout=None):
+    """
+    Block until a background encode of output_path has finished
+
+    Args:
+        output_path (str): Destination path passed to save_image
+        timeout (float): Maximum seconds to wait (None waits forever)
+
+    Returns:
+        bool: True if no encode is pending or it succeeded, False otherwise
+    """
+    with _pending_lock:
+        future = _pending.get(output_path)
+        failed = output_path in _failed
+
+    if future is None:
+        return not failed
+
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        print(f"Error waiting for encode of {output_path}: {str(e)}")
+        return False
+
+
+def encode_error(output_path):
+    """
+    Get the reason a background encode of output_path failed
+
+    Args:
+        output_path (str): Destination path passed to save_image
+
+    Returns:
+        str: Error message, or None if the last encode did not fail
+    """
+    with _pending_lock:
+        return _failed.get(output_path)
+
+
+def discard_output(output_path, timeout=None):
+    """
+    Remove an output file, waiting for any pending encode of it first
+
+    Also forgets a recorded encode failure, so the path can be reused.
+
+    Args:
+        output_path (str): Destination path passed to save_image
+        timeout (float): Maximum seconds to wait for a pending encode
+    """
+    wait_for_encode(output_path, timeout=timeout)
+    with _pending_lock:
+        _failed.pop(output_path, None)
+    if os.path.exists(output_path):
+        os.remove(output_path)
@@ -0,0 +1,279 @@
+import multiprocessing
+import os
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+# Slot boundaries fall on cache lines, which also satisfies every dtype's alignment
+SLOT_ALIGNMENT = 64
+
+# What crosses process boundaries instead of the pixels themselves
+FrameHandle = namedtuple('FrameHandle', ['slot', 'shape', 'dtype'])
+
+
+def _attach(name):
+    """Attach to an existing segment without taking over its cleanup"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching always registers with the resource
+        # tracker; workers started by multiprocessing share the owner's
+        # tracker, so the segment is still only unlinked once (exercised by
+        # check_cross_process)
+        return shared_memory.SharedMemory(name=name)
+
+
+class FramePool:
+    """
+    Fixed-size slots of shared memory for passing images between processes
+
+    Frames are written into a slot once and then read or modified in place
+    by any process holding the pool; only small FrameHandle tuples are sent
+    through queues or pipes. Each slot carries a reference count kept in
+    shared memory, and returns to the pool when the count drops to zero.
+
+    Pass the pool to worker processes as a Process argument (its lock can
+    only be shared when a process is started). Views returned by view()
+    must be dropped before close(). Stages take frames through their
+    array entry points (extract_document, dewarp_image, upscale_array):
+    pass pool.view(handle) as the image and store the result with put(), or
+    pass a view as out when the result's shape is known in advance.
+    `python -m utils.frame_pool [method...]` runs check_cross_process for
+    the given start methods.
+
+    Args:
+        slot_bytes (int): Capacity of each slot (largest frame, in bytes;
+            rounded up to a multiple of SLOT_ALIGNMENT so every frame starts
+            on an aligned address)
+        num_slots (int): Number of frames that can be live at once
+        context: multiprocessing context the workers are started with
+            (defaults to the global one)
+    """
+
+    def __init__(self, slot_bytes, num_slots=8, context=None):
+        self.slot_bytes = -(-int(slot_bytes) // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+        self.num_slots = int(num_slots)
+        self._lock = (context or multiprocessing).Lock()
+        self._data = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.num_slots)
+        self._counts = shared_memory.SharedMemory(create=True, size=8 * self.num_slots)
+        # Forked workers inherit this object as-is, so ownership follows the pid
+        self._owner_pid = os.getpid()
+        self._refs = np.ndarray((self.num_slots,), dtype=np.int64, buffer=self._counts.buf)
+        self._refs[:] = 0
+
+    def __getstate__(self):
+        return {
+            'slot_bytes': self.slot_bytes,
+            'num_slots': self.num_slots,
+            'lock': self._lock,
+            'data': self._data.name,
+            'counts': self._counts.name,
+            'owner_pid': self._owner_pid,
+        }
+
+    def __setstate__(self, state):
+        self.slot_bytes = state['slot_bytes']
+        self.num_slots = state['num_slots']
+        self._lock = state['lock']
+        self._data = _attach(state['data'])
+        self._counts = _attach(state['counts'])
+        self._owner_pid = state['owner_pid']
+        self._refs = np.ndarray((self.num_slots,), dtype=np.int64, buffer=self._counts.buf)
+
+    def allocate(self, shape, dtype=np.uint8):
+        """
+        Reserve a slot for a frame of the given shape
+
+        Args:
+            shape (tuple): Frame shape, e.g. (height, width, 3)
+            dtype: Frame dtype
+
+        Returns:
+            FrameHandle: Handle with a reference count of 1
+
+        Raises:
+            ValueError: If the frame is larger than a slot
+            RuntimeError: If every slot is in use
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {nbytes} bytes does not fit in a {self.slot_bytes}-byte slot")
+
+        with self._lock:
+            free = np.flatnonzero(self._refs == 0)
+            if len(free) == 0:
+                raise RuntimeError("Frame pool exhausted")
+            slot = int(free[0])
+            self._refs[slot] = 1
+
+        return FrameHandle(slot, tuple(int(n) for n in shape), dtype.str)
+
+    def view(self, handle):
+        """
+        Get a writable array backed by the frame's shared memory
+
+        Args:
+            handle (FrameHandle): Frame to access
+
+        Returns:
+            numpy.ndarray: Zero-copy view of the frame
+        """
+        return np.ndarray(
+            handle.shape,
+            dtype=np.dtype(handle.dtype),
+            buffer=self._data.buf,
+            offset=handle.slot * self.slot_bytes
+        )
+
+    def put(self, image):
+        """
+        Copy an array into a new frame
+
+        Args:
+            image (numpy.ndarray): Image or mask to share
+
+        Returns:
+            FrameHandle: Handle with a reference count of 1
+        """
+        handle = self.allocate(image.shape, image.dtype)
+        self.view(handle)[...] = image
+        return handle
+
+    def retain(self, handle):
+        """
+        Add a reference, e.g. before handing the frame to another stage
+
+        Args:
+            handle (FrameHandle): Frame to keep alive
+        """
+        with self._lock:
+            if self._refs[handle.slot] <= 0:
+                raise ValueError(f"Frame in slot {handle.slot} was already released")
+            self._refs[handle.slot] += 1
+
+    def release(self, handle):
+        """
+        Drop a reference; the slot is reused once no references remain
+
+        Args:
+            handle (FrameHandle): Frame to release
+        """
+        with self._lock:
+            if self._refs[handle.slot] <= 0:
+                raise ValueError(f"Frame in slot {handle.slot} was already released")
+            self._refs[handle.slot] -= 1
+
+    def free_slots(self):
+        """
+        Count slots not currently holding a frame
+
+        Returns:
+            int: Number of free slots
+        """
+        with self._lock:
+            return int((self._refs == 0).sum())
+
+    def close(self):
+        """Detach this process from the pool, and remove it if this process created it"""
+        self._refs = None
+        self._data.close()
+        self._counts.close()
+        if os.getpid() == self._owner_pid:
+            self._data.unlink()
+            self._counts.unlink()
+
+
+def read_image_to_pool(pool, image_path):
+    """
+    Decode an image file into a new frame
+
+    Args:
+        pool (FramePool): Pool to store the frame in
+        image_path (str): Path to the image
+
+    Returns:
+        FrameHandle: Handle to the decoded BGR image, or None if it could not be read
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        print(f"Error: Could not read image at {image_path}")
+        return None
+    return pool.put(image)
+
+
+def _check_worker(pool, handle, expected_sum):
+    """Child side of check_cross_process: read, modify in place, release"""
+    view = pool.view(handle)
+    ok = int(view.sum()) == expected_sum
+    if ok:
+        np.subtract(255, view, out=view)
+    del view
+    pool.release(handle)
+    pool.close()
+    if not ok:
+        raise SystemExit(1)
+
+
+def check_cross_process(start_method='spawn'):
+    """
+    Share a frame with a worker process and check refcounts and cleanup
+
+    Runs put -> handle -> worker view/in-place write -> release -> close.
+
+    Args:
+        start_method (str): multiprocessing start method to test
+
+    Returns:
+        bool: True if every step behaved as expected
+    """
+    context = multiprocessing.get_context(start_method)
+    image = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    pool = FramePool(image.nbytes, num_slots=2, context=context)
+    names = (pool._data.name, pool._counts.name)
+
+    handle = pool.put(image)
+    pool.retain(handle)  # Reference handed to the worker
+    worker = context.Process(target=_check_worker, args=(pool, handle, int(image.sum(dtype=np.int64))))
+    worker.start()
+    worker.join()
+
+    checks = {
+        'worker exited cleanly': worker.exitcode == 0,
+        'worker released its reference': pool.free_slots() == pool.num_slots - 1,
+    }
+    view = pool.view(handle)
+    checks['worker write visible'] = np.array_equal(view, 255 - image)
+    del view
+    pool.release(handle)
+    checks['slot returned to pool'] = pool.free_slots() == pool.num_slots
+    pool.close()
+
+    unlinked = True
+    for name in names:
+        try:
+            segment = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        unlinked = False
+        segment.close()
+        segment.unlink()
+    checks['segments unlinked'] = unlinked
+
+    for name, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    return all(checks.values())
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Import by package name so spawned workers can unpickle _check_worker
+    from utils.frame_pool import check_cross_process as check
+
+    methods = sys.argv[1:] or ['spawn']
+    results = [check(method) for method in methods]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .scheduler import set_thread_budget
+
+
+class InferenceBroker:
+    """
+    Collect single-image requests from concurrent jobs into batched forward passes
+
+    A worker thread owns the model. Each request waits in a queue; the
+    worker takes the first waiting image, keeps collecting for up to
+    max_wait_ms or until max_batch_size images are gathered, runs one
+    forward pass on the whole batch, and hands each caller its own result.
+
+    Args:
+        load_model (callable): Returns the model; called once, in the worker thread
+        run_batch (callable): run_batch(model, images) returns one result per image
+        max_batch_size (int): Largest batch to run at once
+        max_wait_ms (float): How long the first image in a batch may wait for others
+        thread_budget (callable): thread_budget(batch_size) returns how many
+            torch threads the worker may use for a batch (None leaves torch's
+            default, every core)
+    """
+
+    def __init__(self, load_model, run_batch, max_batch_size=8, max_wait_ms=5.0,
+                 thread_budget=None):
+        self.load_model = load_model
+        self.run_batch = run_batch
+        self.thread_budget = thread_budget
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._model = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='inference-broker',
+                    daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, image):
+        """
+        Queue an image for the next batch
+
+        Args:
+            image (numpy.ndarray): BGR image
+
+        Returns:
+            Future: Resolves to this image's result
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def infer(self, image, timeout=None):
+        """
+        Run an image through the model as part of a batch and wait for the result
+
+        Args:
+            image (numpy.ndarray): BGR image
+            timeout (float): Maximum seconds to wait (None waits forever)
+
+        Returns:
+            The result run_batch produced for this image
+        """
+        return self.submit(image).result(timeout=timeout)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Still take anything already queued, without waiting
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            futures = [future for _, future in batch]
+
+            try:
+                if self.thread_budget is not None:
+                    # torch's thread count is per calling thread, so the
+                    # budget has to be applied here rather than by the jobs
+                    set_thread_budget(self.thread_budget(len(batch)), opencv=False)
+                if self._model is None:
+                    self._model = self.load_model()
+                results = list(self.run_batch(self._model, [image for image, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"run_batch returned {len(results)} results for {len(batch)} images"
+                    )
+            except Exception as e:
+                # Every caller must be woken, or it would wait forever
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
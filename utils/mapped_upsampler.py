@@ -0,0 +1,59 @@
+import realesrgan
+from realesrgan import RealESRGANer
+
+from .weights import load_mapped_state_dict
+
+
+# realesrgan release whose RealESRGANer.__init__ MappedRealESRGANer mirrors
+MIRRORED_REALESRGAN_VERSION = '0.3.0'
+
+
+def mapped_upsampler_supported():
+    """
+    Check whether the installed realesrgan matches the mirrored constructor
+
+    Returns:
+        bool: True if MappedRealESRGANer can be used safely
+    """
+    return getattr(realesrgan, '__version__', None) == MIRRORED_REALESRGAN_VERSION
+
+
+class MappedRealESRGANer(RealESRGANer):
+    """
+    RealESRGANer whose weights come from a memory-mapped safetensors file
+
+    RealESRGANer.__init__ always unpickles model_path with torch.load, so it
+    cannot be reused as is. This constructor sets the same attributes as
+    RealESRGANer.__init__ in realesrgan 0.3.0 (everything enhance() relies
+    on) and maps the weights instead. Check mapped_upsampler_supported()
+    before use; other realesrgan versions should take the regular path.
+
+    Args:
+        scale (int): Native scale of the network
+        weights_path (str): Path to the converted .safetensors file
+        model (torch.nn.Module): Network matching the weights (may be on the
+            meta device; every parameter is replaced by a mapped tensor)
+        tile (int): Tile size for processing large images (0 = no tiling)
+        tile_pad (int): Padding around each tile
+        pre_pad (int): Padding around the whole image
+        half (bool): Use half precision
+        device (torch.device): Device to run on
+    """
+
+    def __init__(self, scale, weights_path, model, tile=0, tile_pad=10,
+                 pre_pad=10, half=False, device=None):
+        import torch
+
+        self.scale = scale
+        self.tile_size = tile
+        self.tile_pad = tile_pad
+        self.pre_pad = pre_pad
+        self.mod_scale = None
+        self.half = half
+        self.device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+        load_mapped_state_dict(model, weights_path)
+        model.eval()
+        self.model = model.to(self.device)
+        if self.half:
+            self.model = self.model.half()
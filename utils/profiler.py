@@ -0,0 +1,205 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler for a thread and the helper threads it uses
+
+    A background thread periodically captures the Python stack of the
+    profiled thread. Time spent inside OpenCV or torch calls is attributed
+    to the Python line that made the call.
+
+    Threads whose name starts with one of helper_threads (e.g. the inference
+    broker and the encoder pool) are sampled too, under a root frame naming
+    the thread, so work handed off to them shows up instead of an opaque
+    Future.result. Samples where a helper is idle, waiting for work, are
+    skipped. Helper threads are shared, so under concurrent load their
+    samples can include other requests' work.
+
+    Args:
+        interval (float): Seconds between samples
+        thread_id (int): Thread to profile (defaults to the calling thread)
+        helper_threads (tuple): Name prefixes of helper threads to sample
+    """
+
+    def __init__(self, interval=0.005, thread_id=None, helper_threads=()):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.helper_threads = tuple(helper_threads)
+        self.stacks = defaultdict(float)
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._start_time
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _sampled_threads(self):
+        threads = {self.thread_id: None}
+        if self.helper_threads:
+            for thread in threading.enumerate():
+                if thread.ident != self.thread_id and thread.name.startswith(self.helper_threads):
+                    threads[thread.ident] = thread.name
+        return threads
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for thread_id, thread_name in self._sampled_threads().items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self._capture(frame)
+                if thread_name is not None:
+                    if self._is_idle(stack):
+                        continue
+                    stack = ((f"thread {thread_name}", '', 0),) + stack
+                self.stacks[stack] += now - last
+            last = now
+
+    @staticmethod
+    def _capture(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, frame.f_lineno))
+            frame = frame.f_back
+        # Root first, as expected by flamegraph tools
+        return tuple(reversed(stack))
+
+    @staticmethod
+    def _is_idle(stack):
+        """Whether a helper thread is blocked waiting for its next task"""
+        name, filename, _ = stack[-1]
+        # Thread pool worker blocked on its (C-level) work queue
+        if name == '_worker' and filename.endswith(os.path.join('concurrent', 'futures', 'thread.py')):
+            return True
+        # Waiting inside queue.Queue.get (e.g. the inference broker)
+        return any(
+            frame_name == 'get' and os.path.basename(frame_file) == 'queue.py'
+            for frame_name, frame_file, _ in stack
+        )
+
+    def write_collapsed(self, output_path):
+        """
+        Save samples in collapsed-stack format (flamegraph.pl, speedscope)
+
+        Args:
+            output_path (str): Path to the .collapsed file
+        """
+        with open(output_path, 'w') as f:
+            for stack, seconds in sorted(self.stacks.items()):
+                names = ';'.join(
+                    f"{name} ({os.path.basename(filename)}:{line})" if filename else name
+                    for name, filename, line in stack
+                )
+                # Weights are whole microseconds
+                f.write(f"{names} {max(1, round(seconds * 1e6))}\n")
+
+    def write_speedscope(self, output_path, name='profile'):
+        """
+        Save samples in speedscope's JSON format
+
+        Args:
+            output_path (str): Path to the .speedscope.json file
+            name (str): Profile name shown in speedscope
+        """
+        frames = []
+        frame_index = {}
+        samples = []
+        weights = []
+
+        for stack, seconds in self.stacks.items():
+            sample = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(frame_index[frame])
+            samples.append(sample)
+            weights.append(seconds)
+
+        profile = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'utils.profiler',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+        with open(output_path, 'w') as f:
+            json.dump(profile, f)
+
+
+@contextmanager
+def profile_run(output_dir, enabled=False, interval=0.005, name='profile',
+                helper_threads=('inference-broker', 'encoder')):
+    """
+    Profile the enclosed block and save the result in output_dir
+
+    Writes profile.collapsed and profile.speedscope.json. When disabled this
+    does nothing, so it can wrap every request. Helper threads are only
+    sampled while the block runs, so a background encode still going when
+    it exits is cut short.
+
+    Args:
+        output_dir (str): Directory to save profile files in
+        enabled (bool): Whether to profile at all
+        interval (float): Seconds between samples
+        name (str): Profile name shown in speedscope
+        helper_threads (tuple): Name prefixes of helper threads to sample too
+
+    Yields:
+        StackSampler: The running sampler, or None when disabled
+    """
+    if not enabled:
+        yield None
+        return
+
+    sampler = StackSampler(interval=interval, helper_threads=helper_threads)
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            sampler.write_collapsed(os.path.join(output_dir, 'profile.collapsed'))
+            sampler.write_speedscope(
+                os.path.join(output_dir, 'profile.speedscope.json'),
+                name=name
+            )
+            print(f"Profile ({sampler.duration:.2f}s) saved to {output_dir}")
+        except Exception as e:
+            print(f"Error saving profile: {str(e)}")
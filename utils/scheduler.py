@@ -0,0 +1,148 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import cv2
+
+
+def available_cores():
+    """
+    Count the CPU cores this process is allowed to run on
+
+    Returns:
+        int: Number of usable cores
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def set_thread_budget(num_threads, opencv=True):
+    """
+    Limit OpenCV and torch to the given number of threads
+
+    torch's setting applies to work started from the calling thread, while
+    OpenCV's is process-wide.
+
+    Args:
+        num_threads (int): Threads the current job may use
+        opencv (bool): Also set OpenCV's (process-wide) thread count
+    """
+    if opencv:
+        cv2.setNumThreads(num_threads)
+
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(num_threads)
+
+
+class CoreScheduler:
+    """
+    Share the machine's cores between concurrently running jobs
+
+    Each job gets an equal share of the cores, based on how many jobs are
+    running or queued. With a short queue a single job uses every core;
+    as the queue grows, more jobs run side by side with fewer threads each.
+    Jobs beyond max_jobs wait for a running job to finish.
+
+    Threads that use CPU outside any job (such as background encodes) are
+    counted through background_load, a callable returning how many of them
+    are busy right now. Those cores are taken off the jobs' share only
+    while the work runs, and at most half the cores, so jobs still get room
+    on small hosts.
+
+    Args:
+        total_cores (int): Cores to share (defaults to all usable cores)
+        min_cores_per_job (int): Smallest budget a job may be given
+        max_jobs (int): Maximum concurrent jobs (defaults to
+            total_cores // min_cores_per_job, but at least 2 so small hosts
+            still overlap one job's I/O with another's compute)
+        background_load (callable): Returns the number of threads busy
+            outside jobs (None counts none)
+    """
+
+    def __init__(self, total_cores=None, min_cores_per_job=1, max_jobs=None, background_load=None):
+        self.total_cores = max(1, total_cores or available_cores())
+        self.min_cores_per_job = max(1, min(min_cores_per_job, self.total_cores))
+        self.max_jobs = max(1, max_jobs or max(2, self.total_cores // self.min_cores_per_job))
+        self.background_load = background_load
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+
+    def job_cores(self):
+        """
+        Count the cores currently left for jobs after background work
+
+        Returns:
+            int: Cores shared between jobs
+        """
+        busy = self.background_load() if self.background_load is not None else 0
+        return self.total_cores - max(0, min(int(busy), self.total_cores // 2))
+
+    def current_budget(self):
+        """
+        Compute the core budget for a running job given current demand
+
+        Returns:
+            int: Number of threads a job should use
+        """
+        job_cores = self.job_cores()
+        with self._cond:
+            demand = min(self.max_jobs, self._running + self._waiting)
+            return max(self.min_cores_per_job, job_cores // max(1, demand))
+
+    def batch_budget(self, batch_size):
+        """
+        Compute the budget for work done on behalf of several jobs at once
+
+        Used by the inference broker: the jobs in a batch wait while it
+        runs, so it may use their combined budgets.
+
+        Args:
+            batch_size (int): Number of jobs served by the work
+
+        Returns:
+            int: Number of threads to use
+        """
+        return min(self.job_cores(), self.current_budget() * max(1, batch_size))
+
+    def apply_budget(self):
+        """
+        Re-apply the current budget to the calling job's thread pools
+
+        Call this between pipeline stages so long jobs give up cores when
+        new work queues up, and take them back when the queue drains.
+
+        Returns:
+            int: The applied budget
+        """
+        budget = self.current_budget()
+        set_thread_budget(budget)
+        return budget
+
+    @contextmanager
+    def job(self):
+        """
+        Run the enclosed block as a scheduled job
+
+        Blocks until a job slot is free, then applies the job's budget.
+
+        Yields:
+            int: The initial core budget
+        """
+        with self._cond:
+            self._waiting += 1
+            while self._running >= self.max_jobs:
+                self._cond.wait()
+            self._waiting -= 1
+            self._running += 1
+
+        try:
+            yield self.apply_budget()
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify()
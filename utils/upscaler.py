@@ -3,97 +3,238 @@ import numpy as np
 import os
 from PIL import Image
 
+from .encoder import save_image
+from .weights import find_mapped_weights
 
-def upscale_image(image_path, output_path):
+
+def choose_upscale_factor(width, height):
+    """
+    Pick the upscale factor for an image of the given size
+
+    Args:
+        width (int): Image width
+        height (int): Image height
+
+    Returns:
+        int: 4 for small images, 2 for medium ones, 1 if already high resolution
+    """
+    if max(height, width) > 2000:
+        return 1  # Already high resolution
+    if max(height, width) < 800:
+        return 4  # Small images get 4x upscale
+    return 2  # Medium and larger images get 2x upscale
+
+
+def realesrgan_available():
+    """
+    Check whether Real-ESRGAN and its dependencies can be imported
+
+    Returns:
+        bool: True if the neural upscaler can be used
+    """
+    try:
+        from basicsr.archs.rrdbnet_arch import RRDBNet  # noqa: F401
+        from realesrgan import RealESRGANer  # noqa: F401
+        import torch  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def upscale_image(image_path, output_path, encode_options=None,
+                  background_encode=False):
     """
     Upscale image using Real-ESRGAN with smart scaling
 
     Args:
         image_path (str): Path to input image
         output_path (str): Path to save upscaled image
+        encode_options (dict): Output encoding (see build_encode_options)
+        background_encode (bool): Encode the result in the encoder thread pool
 
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        # Try to import Real-ESRGAN
-        try:
-            from basicsr.archs.rrdbnet_arch import RRDBNet
-            from realesrgan import RealESRGANer
-            import torch
-        except ImportError as e:
-            print(f"Real-ESRGAN not properly installed: {e}")
-            print("Falling back to OpenCV upscaling...")
-            return upscale_opencv(image_path, output_path)
-
         # Read the image
         image = cv2.imread(image_path)
         if image is None:
             print(f"Error: Could not read image at {image_path}")
             return False
 
-        # Get image dimensions
-        height, width = image.shape[:2]
+        output = upscale_array(image)
 
-        # Smart scaling decision
-        # If image is already high resolution (> 2000px on any side), skip upscaling
-        if max(height, width) > 2000:
-            print(f"Image already high resolution ({width}x{height}), skipping upscaling")
-            cv2.imwrite(output_path, image)
-            return True
+        # Save the upscaled image
+        if not save_image(output, output_path, encode_options, background_encode):
+            return False
 
-        # Determine scale factor based on image size
-        if max(height, width) < 800:
-            scale = 4  # Small images get 4x upscale
-        elif max(height, width) < 1500:
-            scale = 2  # Medium images get 2x upscale
-        else:
-            scale = 2  # Larger images get 2x upscale
+        print(f"Image upscaled successfully to {output.shape[1]}x{output.shape[0]}")
+        print(f"Saved to {output_path}")
+        return True
 
-        print(f"Upscaling image from {width}x{height} with {scale}x factor...")
+    except Exception as e:
+        print(f"Error in upscaling: {str(e)}")
+        return False
 
-        # Initialize Real-ESRGAN model
-        model_name = 'RealESRGAN_x4plus'  # Best for general images and documents
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
 
-        # Determine device
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+def upscale_array(image, opencv=False, out=None):
+    """
+    Upscale an image array with smart scaling
 
-        # Model path (will auto-download if not exists)
-        model_path = os.path.join('models', 'realesrgan', f'{model_name}.pth')
+    Array-in/array-out counterpart of upscale_image and upscale_opencv, for
+    frames that are already in memory such as FramePool views. The input is
+    only read. Real-ESRGAN failures fall back to OpenCV upscaling.
 
-        # Initialize upsampler
-        upsampler = RealESRGANer(
-            scale=4,  # Model is trained for 4x, we'll resize after if needed
-            model_path=model_path,
-            model=model,
-            tile=400,  # Tile size for processing large images
-            tile_pad=10,
-            pre_pad=0,
-            half=True if device.type == 'cuda' else False,
-            device=device
-        )
+    Args:
+        image (numpy.ndarray): Input BGR image
+        opencv (bool): Use OpenCV upscaling only
+        out (numpy.ndarray): Array to write the result into, e.g. a shared
+            frame; only used when it has the result's shape and dtype
 
-        # Upscale the image
-        output, _ = upsampler.enhance(image, outscale=scale)
+    Returns:
+        numpy.ndarray: Upscaled image (out when it was used, image itself
+            when it is already high resolution)
+    """
+    height, width = image.shape[:2]
+
+    # Smart scaling decision
+    scale = choose_upscale_factor(width, height)
+
+    # If image is already high resolution (> 2000px on any side), skip upscaling
+    if scale == 1:
+        print(f"Image already high resolution ({width}x{height}), skipping upscaling")
+        output = image
+    elif opencv:
+        print(f"OpenCV upscaling from {width}x{height} to {int(width * scale)}x{int(height * scale)}")
+        output = resize_and_sharpen(image, scale)
+    else:
+        try:
+            output = realesrgan_upscale(image, scale)
+        except ImportError as e:
+            print(f"Real-ESRGAN not properly installed: {e}")
+            print("Falling back to OpenCV upscaling...")
+            output = resize_and_sharpen(image, scale)
+        except Exception as e:
+            print(f"Error in Real-ESRGAN upscaling: {str(e)}")
+            print("Falling back to OpenCV upscaling...")
+            output = resize_and_sharpen(image, scale)
 
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if out is not None and out.shape == output.shape and out.dtype == output.dtype:
+        np.copyto(out, output)
+        return out
+    return output
 
-        # Save the upscaled image
-        cv2.imwrite(output_path, output)
 
-        print(f"Image upscaled successfully to {output.shape[1]}x{output.shape[0]}")
-        print(f"Saved to {output_path}")
-        return True
+def realesrgan_upscale(image, scale):
+    """
+    Upscale an image array with Real-ESRGAN
 
-    except Exception as e:
-        print(f"Error in Real-ESRGAN upscaling: {str(e)}")
-        print("Falling back to OpenCV upscaling...")
-        return upscale_opencv(image_path, output_path)
+    Args:
+        image (numpy.ndarray): Input BGR image
+        scale (int): Upscale factor
+
+    Returns:
+        numpy.ndarray: Upscaled image
+
+    Raises:
+        ImportError: If Real-ESRGAN or torch is not installed
+    """
+    from basicsr.archs.rrdbnet_arch import RRDBNet
+    from realesrgan import RealESRGANer  # noqa: F401
+    import torch
+
+    height, width = image.shape[:2]
+    print(f"Upscaling image from {width}x{height} with {scale}x factor...")
+
+    # Real-ESRGAN network (built by create_upsampler, on the meta device
+    # when its weights are memory-mapped)
+    model_name = 'RealESRGAN_x4plus'  # Best for general images and documents
+    def build_model():
+        return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
+
+    # Determine device
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    # Model path (will auto-download if not exists)
+    model_path = os.path.join('models', 'realesrgan', f'{model_name}.pth')
+
+    # Initialize upsampler
+    upsampler = create_upsampler(
+        model_path,
+        build_model,
+        scale=4,  # Model is trained for 4x, we'll resize after if needed
+        tile=400,  # Tile size for processing large images
+        tile_pad=10,
+        pre_pad=0,
+        half=True if device.type == 'cuda' else False,
+        device=device
+    )
+
+    # Upscale the image
+    output, _ = upsampler.enhance(image, outscale=scale)
+    return output
+
+
+def create_upsampler(model_path, build_model, scale, tile, tile_pad, pre_pad, half, device):
+    """
+    Create a RealESRGANer, using memory-mapped safetensors weights when available
+
+    With mapped weights the network is built on the meta device, so no
+    memory is allocated or randomly initialised for weights that the mapped
+    tensors replace.
 
+    Args:
+        model_path (str): Path to the Real-ESRGAN .pth checkpoint
+        build_model (callable): Returns the network matching the checkpoint
+        scale (int): Native scale of the network
+        tile (int): Tile size for processing large images
+        tile_pad (int): Padding around each tile
+        pre_pad (int): Padding around the whole image
+        half (bool): Use half precision
+        device (torch.device): Device to run on
 
-def upscale_opencv(image_path, output_path, scale=2):
+    Returns:
+        RealESRGANer: Ready-to-use upsampler
+    """
+    import torch
+    from realesrgan import RealESRGANer
+    from .mapped_upsampler import MappedRealESRGANer, mapped_upsampler_supported
+
+    weights_path = find_mapped_weights(model_path)
+    if weights_path is not None and not mapped_upsampler_supported():
+        print("Installed realesrgan version is not supported for mapped weights, "
+              "loading the .pth checkpoint instead")
+        weights_path = None
+
+    if weights_path is None:
+        return RealESRGANer(
+            scale=scale,
+            model_path=model_path,
+            model=build_model(),
+            tile=tile,
+            tile_pad=tile_pad,
+            pre_pad=pre_pad,
+            half=half,
+            device=device
+        )
+
+    with torch.device('meta'):
+        model = build_model()
+
+    return MappedRealESRGANer(
+        scale=scale,
+        weights_path=weights_path,
+        model=model,
+        tile=tile,
+        tile_pad=tile_pad,
+        pre_pad=pre_pad,
+        half=half,
+        device=device
+    )
+
+
+def upscale_opencv(image_path, output_path, scale=2, encode_options=None,
+                   background_encode=False):
     """
     Fallback upscaling using OpenCV (if Real-ESRGAN fails)
 
@@ -101,6 +242,8 @@ def upscale_opencv(image_path, output_path, scale=2):
         image_path (str): Path to input image
         output_path (str): Path to save upscaled image
         scale (int): Upscale factor
+        encode_options (dict): Output encoding (see build_encode_options)
+        background_encode (bool): Encode the result in the encoder thread pool
 
     Returns:
         bool: True if successful, False otherwise
@@ -112,43 +255,11 @@ def upscale_opencv(image_path, output_path, scale=2):
             print(f"Error: Could not read image at {image_path}")
             return False
 
-        # Get image dimensions
-        height, width = image.shape[:2]
-
-        # Skip if already high resolution
-        if max(height, width) > 2000:
-            cv2.imwrite(output_path, image)
-            return True
-
-        # Determine scale factor
-        if max(height, width) < 800:
-            scale = 4
-        elif max(height, width) < 1500:
-            scale = 2
-        else:
-            scale = 2
-
-        # Calculate new dimensions
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-
-        print(f"OpenCV upscaling from {width}x{height} to {new_width}x{new_height}")
-
-        # Upscale using Lanczos interpolation (best quality)
-        upscaled = cv2.resize(
-            image,
-            (new_width, new_height),
-            interpolation=cv2.INTER_LANCZOS4
-        )
-
-        # Optional: Apply unsharp mask for better clarity
-        upscaled = unsharp_mask(upscaled)
-
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        upscaled = upscale_array(image, opencv=True)
 
         # Save the upscaled image
-        cv2.imwrite(output_path, upscaled)
+        if not save_image(upscaled, output_path, encode_options, background_encode):
+            return False
 
         print(f"Image upscaled successfully using OpenCV")
         return True
@@ -158,6 +269,30 @@ def upscale_opencv(image_path, output_path, scale=2):
         return False
 
 
+def resize_and_sharpen(image, scale):
+    """
+    Upscale with Lanczos interpolation and sharpen the result
+
+    Args:
+        image (numpy.ndarray): Input image
+        scale (int): Upscale factor
+
+    Returns:
+        numpy.ndarray: Upscaled image
+    """
+    height, width = image.shape[:2]
+
+    # Upscale using Lanczos interpolation (best quality)
+    upscaled = cv2.resize(
+        image,
+        (int(width * scale), int(height * scale)),
+        interpolation=cv2.INTER_LANCZOS4
+    )
+
+    # Optional: Apply unsharp mask for better clarity
+    return unsharp_mask(upscaled)
+
+
 def unsharp_mask(image, kernel_size=(5, 5), sigma=1.0, amount=1.5, threshold=0):
     """
     Apply unsharp mask to enhance image sharpness
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+
+
+# Default checkpoints shipped with the app
+YOLO_CHECKPOINT = os.path.join('models', 'trainedYOLO.pt')
+REALESRGAN_CHECKPOINT = os.path.join('models', 'realesrgan', 'RealESRGAN_x4plus.pth')
+
+
+def mapped_weights_path(checkpoint_path):
+    """
+    Get the safetensors path that sits next to a pickle checkpoint
+
+    Args:
+        checkpoint_path (str): Path to a .pt/.pth checkpoint
+
+    Returns:
+        str: Path of the matching .safetensors file
+    """
+    return os.path.splitext(checkpoint_path)[0] + '.safetensors'
+
+
+def find_mapped_weights(checkpoint_path):
+    """
+    Return the safetensors file for a checkpoint if it exists and can be loaded
+
+    Args:
+        checkpoint_path (str): Path to a .pt/.pth checkpoint
+
+    Returns:
+        str: Path to the .safetensors file, or None to use the pickle checkpoint
+    """
+    path = mapped_weights_path(checkpoint_path)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        import safetensors  # noqa: F401
+    except ImportError:
+        print("safetensors not installed, loading pickle checkpoint instead")
+        return None
+
+    return path
+
+
+def read_weights_metadata(weights_path):
+    """
+    Read the metadata stored in a safetensors header without loading tensors
+
+    Args:
+        weights_path (str): Path to a .safetensors file
+
+    Returns:
+        dict: Metadata strings stored at conversion time
+    """
+    from safetensors import safe_open
+
+    with safe_open(weights_path, framework='pt') as f:
+        return f.metadata() or {}
+
+
+def load_mapped_state_dict(model, weights_path):
+    """
+    Load safetensors weights into a model without copying them
+
+    The tensors are backed by a copy-on-write memory map of the file, and
+    assign=True makes them the model parameters directly, so every worker
+    on a host reads the same pages from the OS page cache.
+
+    Args:
+        model (torch.nn.Module): Model with the matching architecture
+        weights_path (str): Path to a .safetensors file
+
+    Returns:
+        torch.nn.Module: The model with its weights loaded
+    """
+    from safetensors.torch import load_file
+
+    state_dict = load_file(weights_path, device='cpu')
+    model.load_state_dict(state_dict, strict=True, assign=True)
+    return model
+
+
+def convert_yolo_checkpoint(checkpoint_path, output_path=None):
+    """
+    Convert an ultralytics .pt checkpoint to safetensors
+
+    The network is fused (Conv + BatchNorm) before saving so the loader can
+    use the weights as-is. The model definition, class names and predict
+    arguments are kept in the file metadata.
+
+    Args:
+        checkpoint_path (str): Path to the YOLO .pt checkpoint
+        output_path (str): Path to the .safetensors file (defaults to sibling)
+
+    Returns:
+        str: Path to the written file
+    """
+    from safetensors.torch import save_file
+    from ultralytics import YOLO
+
+    output_path = output_path or mapped_weights_path(checkpoint_path)
+
+    yolo = YOLO(checkpoint_path)
+    model = yolo.model.float().fuse(verbose=False).eval()
+
+    state_dict = {k: v.detach().contiguous() for k, v in model.state_dict().items()}
+    metadata = {
+        'format': 'ultralytics',
+        'task': yolo.task,
+        'yaml': json.dumps(model.yaml),
+        'names': json.dumps(model.names),
+        'args': json.dumps(yolo.overrides),
+    }
+
+    save_file(state_dict, output_path, metadata=metadata)
+    print(f"Converted {checkpoint_path} to {output_path}")
+    return output_path
+
+
+def convert_realesrgan_checkpoint(checkpoint_path, output_path=None):
+    """
+    Convert a Real-ESRGAN .pth checkpoint to safetensors
+
+    Args:
+        checkpoint_path (str): Path to the Real-ESRGAN .pth checkpoint
+        output_path (str): Path to the .safetensors file (defaults to sibling)
+
+    Returns:
+        str: Path to the written file
+    """
+    import torch
+    from safetensors.torch import save_file
+
+    output_path = output_path or mapped_weights_path(checkpoint_path)
+
+    loadnet = torch.load(checkpoint_path, map_location=torch.device('cpu'))
+
+    # Same key preference as RealESRGANer
+    keyname = 'params_ema' if 'params_ema' in loadnet else 'params'
+    state_dict = {k: v.contiguous() for k, v in loadnet[keyname].items()}
+
+    save_file(state_dict, output_path, metadata={'format': 'realesrgan'})
+    print(f"Converted {checkpoint_path} to {output_path}")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert model checkpoints to memory-mappable safetensors files'
+    )
+    parser.add_argument('--yolo', default=YOLO_CHECKPOINT,
+                        help='YOLO .pt checkpoint')
+    parser.add_argument('--realesrgan', default=REALESRGAN_CHECKPOINT,
+                        help='Real-ESRGAN .pth checkpoint')
+    args = parser.parse_args()
+
+    if os.path.exists(args.yolo):
+        convert_yolo_checkpoint(args.yolo)
+    else:
+        print(f"Skipping YOLO conversion, {args.yolo} not found")
+
+    if os.path.exists(args.realesrgan):
+        convert_realesrgan_checkpoint(args.realesrgan)
+    else:
+        print(f"Skipping Real-ESRGAN conversion, {args.realesrgan} not found")
+
+
+if __name__ == '__main__':
+    main()
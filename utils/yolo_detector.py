@@ -1,8 +1,222 @@
 import cv2
 import numpy as np
 import torch
+import ultralytics
 from ultralytics import YOLO
 import os
+import json
+import threading
+from pathlib import Path
+
+from .inference_broker import InferenceBroker
+from .weights import find_mapped_weights, load_mapped_state_dict, read_weights_metadata
+
+
+# ultralytics release whose Model._load and attribute layout MappedYOLO mirrors
+MIRRORED_ULTRALYTICS_VERSION = '8.0.232'
+
+
+class MappedYOLO(YOLO):
+    """
+    YOLO model that can be loaded from a memory-mapped safetensors file
+
+    Files produced by utils.weights.convert_yolo_checkpoint are rebuilt from
+    the stored model definition and mapped instead of unpickled; any other
+    path is loaded the usual ultralytics way. This overrides the private
+    Model._load of ultralytics 8.0.232, so load_yolo_model only uses it with
+    that version.
+    """
+
+    def _load(self, weights, task=None):
+        if Path(weights).suffix != '.safetensors':
+            return super()._load(weights, task)
+
+        from ultralytics.nn.tasks import DetectionModel, SegmentationModel
+
+        metadata = read_weights_metadata(weights)
+        task = metadata['task']
+        model_classes = {'detect': DetectionModel, 'segment': SegmentationModel}
+        if task not in model_classes:
+            raise ValueError(f"Unsupported YOLO task in {weights}: {task}")
+
+        # Build the fused network so its layout matches the converted weights
+        model = model_classes[task](json.loads(metadata['yaml']), verbose=False)
+        model = model.fuse(verbose=False)
+        load_mapped_state_dict(model, weights)
+        model.names = {int(k): v for k, v in json.loads(metadata['names']).items()}
+        model.eval()
+
+        self.model = model
+        self.task = task
+        self.ckpt = None
+        self.ckpt_path = weights
+        self.overrides = json.loads(metadata['args'])
+        self.overrides['model'] = weights
+        self.overrides['task'] = task
+        self.model.args = self.overrides
+        self.model.task = task
+
+
+def load_yolo_model(model_path):
+    """
+    Load the YOLO model, preferring memory-mapped safetensors weights
+
+    Args:
+        model_path (str): Path to trained YOLO model (.pt)
+
+    Returns:
+        YOLO: Loaded model
+    """
+    weights_path = find_mapped_weights(model_path)
+    if weights_path is not None and getattr(ultralytics, '__version__', None) != MIRRORED_ULTRALYTICS_VERSION:
+        print("Installed ultralytics version is not supported for mapped weights, "
+              "loading the .pt checkpoint instead")
+        weights_path = None
+
+    if weights_path is not None:
+        return MappedYOLO(weights_path)
+    return YOLO(model_path)
+
+
+# Micro-batching of concurrent detection requests (see configure_batching)
+_max_batch_size = 8
+_max_wait_ms = 5.0
+_thread_budget = None
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def configure_batching(max_batch_size, max_wait_ms, thread_budget=None):
+    """
+    Set how detection requests from concurrent jobs are batched
+
+    Applies to brokers created after the call.
+
+    Args:
+        max_batch_size (int): Largest batch per forward pass (1 disables batching)
+        max_wait_ms (float): How long a request may wait for others to join its batch
+        thread_budget (callable): thread_budget(batch_size) returns the torch
+            threads for a batch, e.g. CoreScheduler.batch_budget
+    """
+    global _max_batch_size, _max_wait_ms, _thread_budget
+    _max_batch_size = max(1, int(max_batch_size))
+    _max_wait_ms = max(0.0, float(max_wait_ms))
+    _thread_budget = thread_budget
+
+
+def first_masks(model, images):
+    """
+    Run one batched forward pass and keep the first mask of each image
+
+    Args:
+        model (YOLO): Loaded model
+        images (list): BGR images, possibly of different sizes
+
+    Returns:
+        list: Float mask at the image's own resolution, or None, per image
+    """
+    from ultralytics.utils.ops import scale_image
+
+    results = model(images)
+
+    masks = []
+    for image, result in zip(images, results):
+        if result.masks is None or len(result.masks.data) == 0:
+            masks.append(None)
+            continue
+        # Masks come back at the letterboxed network input size; remove that
+        # image's padding and scale back so batching does not shift the mask.
+        # Only the first mask is brought to full resolution.
+        mask = scale_image(result.masks.data[0].cpu().numpy(), image.shape)
+        masks.append(mask[:, :, 0] if mask.ndim == 3 else mask)
+    return masks
+
+
+def get_broker(model_path):
+    """
+    Get the inference broker serving a model, creating it on first use
+
+    The model is loaded once per process, by the broker's worker thread.
+
+    Args:
+        model_path (str): Path to trained YOLO model
+
+    Returns:
+        InferenceBroker: Broker returning the first mask of each image
+    """
+    with _brokers_lock:
+        broker = _brokers.get(model_path)
+        if broker is None:
+            broker = InferenceBroker(
+                lambda: load_yolo_model(model_path),
+                first_masks,
+                max_batch_size=_max_batch_size,
+                max_wait_ms=_max_wait_ms,
+                thread_budget=_thread_budget
+            )
+            _brokers[model_path] = broker
+        return broker
+
+
+def extract_document(image, mask, out=None):
+    """
+    Cut the document out of an image using its segmentation mask
+    
+    Args:
+        image (numpy.ndarray): Input image
+        mask (numpy.ndarray): Float document mask from the model
+        out (numpy.ndarray): Array to write the result into, e.g. a shared
+            frame (may be image itself to extract in place)
+    
+    Returns:
+        numpy.ndarray: Document on a white background, or None if the mask is empty
+    """
+    # Convert mask to binary image
+    binary_mask = (mask > 0.5).astype(np.uint8) * 255
+    
+    # Resize mask to original image size if needed
+    if binary_mask.shape[:2] != image.shape[:2]:
+        binary_mask = cv2.resize(
+            binary_mask, 
+            (image.shape[1], image.shape[0]),
+            interpolation=cv2.INTER_NEAREST
+        )
+    
+    # Find contours
+    contours, _ = cv2.findContours(
+        binary_mask, 
+        cv2.RETR_EXTERNAL, 
+        cv2.CHAIN_APPROX_SIMPLE
+    )
+    
+    if not contours:
+        print("No contours found in mask")
+        return None
+    
+    # Find the largest contour (main document)
+    largest_contour = max(contours, key=cv2.contourArea)
+    
+    # Create a blank mask and fill the largest contour
+    filled_mask = np.zeros_like(binary_mask)
+    cv2.drawContours(filled_mask, [largest_contour], -1, 255, -1)
+    
+    # Morphological operations to clean up the mask
+    kernel = np.ones((3, 3), np.uint8)
+    filled_mask = cv2.morphologyEx(
+        filled_mask, 
+        cv2.MORPH_CLOSE, 
+        kernel, 
+        iterations=2
+    )
+    
+    # Keep the document and paint everything else white
+    if out is None:
+        out = image.copy()
+    elif out is not image:
+        np.copyto(out, image)
+    out[filled_mask == 0] = 255
+    
+    return out
 
 
 def detect_and_extract_document(image_path, model_path, output_path):
@@ -18,89 +232,30 @@ def detect_and_extract_document(image_path, model_path, output_path):
         bool: True if successful, False otherwise
     """
     try:
-        # Check if model exists
-        if not os.path.exists(model_path):
+        # Check if model exists (the converted .safetensors file is enough)
+        if not os.path.exists(model_path) and find_mapped_weights(model_path) is None:
             print(f"Error: Model not found at {model_path}")
             return False
         
-        # Load the YOLO model
-        model = YOLO(model_path)
-        
         # Read the image
         image = cv2.imread(image_path)
         if image is None:
             print(f"Error: Could not read image at {image_path}")
             return False
         
-        # Run inference
-        results = model(image)[0]
+        # Run inference, batched with concurrent requests
+        # (first mask, assuming single document detection)
+        mask = get_broker(model_path).infer(image)
         
         # Check if masks were detected
-        if results.masks is None or len(results.masks.data) == 0:
+        if mask is None:
             print("No document detected in image")
             return False
         
-        # Get the first mask (assuming single document detection)
-        mask = results.masks.data[0].cpu().numpy()
-        
-        # Convert mask to binary image
-        binary_mask = (mask > 0.5).astype(np.uint8) * 255
-        
-        # Resize mask to original image size if needed
-        if binary_mask.shape[:2] != image.shape[:2]:
-            binary_mask = cv2.resize(
-                binary_mask, 
-                (image.shape[1], image.shape[0]),
-                interpolation=cv2.INTER_NEAREST
-            )
-        
-        # Find contours
-        contours, _ = cv2.findContours(
-            binary_mask, 
-            cv2.RETR_EXTERNAL, 
-            cv2.CHAIN_APPROX_SIMPLE
-        )
-        
-        if not contours:
-            print("No contours found in mask")
+        result = extract_document(image, mask)
+        if result is None:
             return False
         
-        # Find the largest contour (main document)
-        largest_contour = max(contours, key=cv2.contourArea)
-        
-        # Create a blank mask and fill the largest contour
-        filled_mask = np.zeros_like(binary_mask)
-        cv2.drawContours(filled_mask, [largest_contour], -1, 255, -1)
-        
-        # Morphological operations to clean up the mask
-        kernel = np.ones((3, 3), np.uint8)
-        filled_mask = cv2.morphologyEx(
-            filled_mask, 
-            cv2.MORPH_CLOSE, 
-            kernel, 
-            iterations=2
-        )
-        
-        # Create a binary mask for extraction
-        filled_mask_binary = (filled_mask > 0).astype(np.uint8)
-        
-        # Extract document using the mask
-        extracted_document = cv2.bitwise_and(
-            image, 
-            image, 
-            mask=filled_mask_binary
-        )
-        
-        # Create a white background
-        white_background = np.ones_like(image) * 255
-        
-        # Replace black regions with white
-        result = np.where(
-            filled_mask_binary[:, :, np.newaxis] == 1,
-            extracted_document,
-            white_background
-        )
-        
         # Ensure output directory exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
@@ -127,18 +282,16 @@ def get_document_bounds(image_path, model_path):
         tuple: (x, y, w, h) bounding box coordinates or None if failed
     """
     try:
-        model = YOLO(model_path)
         image = cv2.imread(image_path)
         
         if image is None:
             return None
         
-        results = model(image)[0]
+        mask = get_broker(model_path).infer(image)
         
-        if results.masks is None or len(results.masks.data) == 0:
+        if mask is None:
             return None
         
-        mask = results.masks.data[0].cpu().numpy()
         binary_mask = (mask > 0.5).astype(np.uint8) * 255
         
         if binary_mask.shape[:2] != image.shape[:2]: